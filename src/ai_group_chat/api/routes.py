@@ -5,7 +5,7 @@ from pathlib import Path
 import yaml
 import json
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from loguru import logger
 
 from ..models import (
@@ -331,8 +331,8 @@ async def summarize_discussion(group_id: str, request: SummarizeRequest):
 
 @router.get("/groups/{group_id}/messages", response_model=list[Message])
 async def get_messages(group_id: str, limit: int = 50):
-    """获取群聊消息历史"""
-    return chat_service.get_messages(group_id, limit)
+    """获取群聊消息历史（数据库行直接序列化为 JSON，跳过 Message 模型构造与校验）"""
+    return Response(content=chat_service.get_messages_json(group_id, limit), media_type="application/json")
 
 
 # ============ 模型能力 ============
@@ -31,6 +31,9 @@ class Settings(BaseSettings):
     mem_embedding_model: str = "text-embedding-3-small"
     mem_embedding_dimensions: int = 1536
 
+    # 上下文压缩配置
+    summary_concurrency: int = 8  # 摘要 LLM 调用的并发上限（多个群同时压缩时）
+
     # LangSmith 追踪配置
     langchain_tracing_v2: bool = False
     langchain_endpoint: str = "https://api.smith.langchain.com"
@@ -4,11 +4,18 @@
 提供数据库连接和通用的行转对象方法
 """
 
+import json
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
 from .database import db, Database
 
+# 可选依赖：安装 orjson 时 JSON 序列化走 C 实现，否则回退标准库
+try:
+    import orjson
+except (ImportError, ModuleNotFoundError):
+    orjson = None
+
 
 class BaseDAO:
     """
@@ -22,9 +29,30 @@ class BaseDAO:
     
     @staticmethod
     def parse_datetime(value) -> datetime:
-        """解析日期时间字段（兼容 PostgreSQL 和 SQLite）"""
+        """
+        解析日期时间字段
+
+        psycopg2 对 TIMESTAMP 列总是返回 datetime，作为首个分支直接放行；
+        字符串（如 SQLite 或 JSON 来源）与 NULL 只在少见路径上处理。
+        """
+        if type(value) is datetime:
+            return value
+        if value is None:
+            return datetime.now()
         if isinstance(value, str):
             return datetime.fromisoformat(value)
-        elif value is None:
-            return datetime.now()
         return value
+
+    @staticmethod
+    def dumps_json(value: Any) -> str:
+        """序列化为 JSON 文本（保留非 ASCII 字符，无法直接序列化的值转为字符串）"""
+        if orjson is not None:
+            return orjson.dumps(value, default=str).decode("utf-8")
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def dumps_json_bytes(value: Any) -> bytes:
+        """序列化为 UTF-8 JSON 字节（供接口直接返回，省去一次 str -> bytes 编码）"""
+        if orjson is not None:
+            return orjson.dumps(value, default=str)
+        return json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
@@ -36,7 +36,7 @@ class ContextSnapshotDAO(BaseDAO):
                 # Pydantic v1
                 data = [msg.dict() for msg in context_messages]
                 
-            context_content = json.dumps(data, ensure_ascii=False, default=str)
+            context_content = self.dumps_json(data)
             
         except Exception as e:
             # Fallback
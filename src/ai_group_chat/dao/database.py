@@ -1,8 +1,12 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+import threading
 import time
+from functools import lru_cache
 from loguru import logger
-from typing import Optional, Any
+from typing import Optional, Any, Iterator
+from uuid import uuid4
 
 # Docker Compose Configuration
 DB_CONFIG = {
@@ -13,20 +17,100 @@ DB_CONFIG = {
     "port": "5432"
 }
 
+
+@lru_cache(maxsize=512)
+def _to_pg_sql(sql: str) -> str:
+    """将 SQLite 风格 ? 占位符转为 Postgres %s（按 SQL 文本缓存，热点语句只转换一次）"""
+    return sql.replace('?', '%s')
+
+
 class Database:
+    POOL_MIN_CONN = 5  # 连接池常驻的空闲连接数
+    POOL_MAX_CONN = 25  # 连接池最大连接数（超出时调用方排队等待，而不是报错）
+    INIT_RETRY_BACKOFF = 5.0  # 请求路径初始化失败后，该时长内直接报错而不是再次连库（秒）
+
     def __init__(self):
-        self._wait_for_db()
-        self._init_db()
+        # 导入期不连库：首次使用（或应用 lifespan 启动时）再等待数据库并初始化表结构
+        self._ready = False
+        self._init_lock = threading.Lock()
+        self._init_failed_at: Optional[float] = None
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool 用尽时直接抛 PoolError，用信号量把超额请求变成阻塞等待
+        self._conn_slots = threading.BoundedSemaphore(self.POOL_MAX_CONN)
 
-    def _get_conn(self):
+    @staticmethod
+    def is_transient_error(exc: BaseException) -> bool:
+        """连接断开、数据库重启等瞬时错误（可重试）；SQL/约束错误不在此列"""
+        return isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+    def initialize(self, wait: bool = True) -> bool:
+        """
+        初始化表结构（幂等；失败时下次使用会重试）
+
+        wait=True 用于应用启动：先等待数据库可用。请求路径传 wait=False：不等待、不排队，
+        其他线程正在初始化或距上次失败不足 INIT_RETRY_BACKOFF 时直接返回 False。
+        """
+        if self._ready:
+            return True
+        if not self._init_lock.acquire(blocking=wait):
+            return False
+        try:
+            if self._ready:
+                return True
+            if not wait and self._init_failed_at is not None \
+                    and time.monotonic() - self._init_failed_at < self.INIT_RETRY_BACKOFF:
+                return False
+            if wait:
+                self._wait_for_db()
+            self._ready = self._init_db()
+            self._init_failed_at = None if self._ready else time.monotonic()
+            return self._ready
+        finally:
+            self._init_lock.release()
+
+    def _connect(self):
         return psycopg2.connect(**DB_CONFIG)
 
+    def _get_pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.POOL_MIN_CONN, self.POOL_MAX_CONN, **DB_CONFIG)
+        return self._pool
+
+    def _get_conn(self):
+        """从连接池借出连接（用完必须 _release 归还）"""
+        if not self._ready and not self.initialize(wait=False):
+            # 数据库未就绪时快速失败，不在请求线程里重复等待重连
+            raise psycopg2.OperationalError("数据库尚未就绪")
+        self._conn_slots.acquire()
+        try:
+            return self._get_pool().getconn()
+        except Exception:
+            self._conn_slots.release()
+            raise
+
+    def _release(self, conn) -> None:
+        """归还连接：未结束的事务由连接池回滚，已断开的连接直接丢弃"""
+        try:
+            self._get_pool().putconn(conn, close=bool(conn.closed))
+        finally:
+            self._conn_slots.release()
+
+    def close(self) -> None:
+        """关闭连接池中的全部连接（应用退出时调用）"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
     def _wait_for_db(self):
         """Wait for Postgres availability"""
         retries = 5
         while retries > 0:
             try:
-                conn = self._get_conn()
+                conn = self._connect()
                 conn.close()
                 return
             except psycopg2.OperationalError as e:
@@ -35,10 +119,10 @@ class Database:
                 retries -= 1
         logger.error("❌ Could not connect to Postgres database.")
 
-    def _init_db(self):
+    def _init_db(self) -> bool:
         """Initialize Postgres schema"""
         try:
-            conn = self._get_conn()
+            conn = self._connect()
             cur = conn.cursor()
             
             # Groups Table
@@ -158,6 +242,10 @@ class Database:
                 CREATE INDEX IF NOT EXISTS idx_ltm_group_lookup
                 ON long_term_memories(group_id, scope, is_active, updated_at)
             """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_ltm_fingerprint
+                ON long_term_memories(fingerprint)
+            """)
 
             # 增量归档游标
             cur.execute("""
@@ -194,7 +282,7 @@ class Database:
                     user_id TEXT,
                     event_type TEXT NOT NULL,
                     scope TEXT,
-                    memory_ids TEXT,
+                    memory_ids TEXT[],
                     detail TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
@@ -217,6 +305,26 @@ class Database:
             for col_name, col_type in message_columns:
                 self._safe_add_column(conn, cur, "messages", col_name, col_type)
 
+            # 消息按 (group_id, created_at, id) 顺序读取：最新 N 条 / 游标增量都走索引有序扫描
+            self._safe_execute(
+                conn,
+                cur,
+                """
+                CREATE INDEX IF NOT EXISTS idx_messages_group_created
+                ON messages(group_id, created_at, id)
+                """,
+            )
+
+            # 成员总是按群读取（构建群聊、批量 list_groups）
+            self._safe_execute(
+                conn,
+                cur,
+                """
+                CREATE INDEX IF NOT EXISTS idx_members_group
+                ON members(group_id)
+                """,
+            )
+
             group_columns = [
                 ("compression_threshold", "REAL DEFAULT 0.8"),
                 ("memory_enabled", "BOOLEAN DEFAULT TRUE"),
@@ -233,6 +341,35 @@ class Database:
             for col_name, col_type in group_columns:
                 self._safe_add_column(conn, cur, "groups", col_name, col_type)
 
+            # 审计日志 memory_ids：旧库逗号拼接文本 -> text[]，并建立 GIN 索引支持 @> 检索
+            self._safe_execute(
+                conn,
+                cur,
+                """
+                DO $$
+                BEGIN
+                    IF EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'memory_audit_logs'
+                          AND column_name = 'memory_ids'
+                          AND data_type = 'text'
+                    ) THEN
+                        ALTER TABLE memory_audit_logs
+                        ALTER COLUMN memory_ids TYPE TEXT[]
+                        USING string_to_array(memory_ids, ',');
+                    END IF;
+                END $$
+                """,
+            )
+            self._safe_execute(
+                conn,
+                cur,
+                """
+                CREATE INDEX IF NOT EXISTS idx_audit_memory_ids
+                ON memory_audit_logs USING gin (memory_ids)
+                """,
+            )
+
             if vector_enabled:
                 self._safe_add_column(conn, cur, "long_term_memories", "embedding", "VECTOR(1536)")
                 self._safe_add_column(conn, cur, "long_term_memories", "embedding_model", "TEXT")
@@ -251,8 +388,10 @@ class Database:
             conn.commit()
             conn.close()
             logger.info(f"🔗 数据库: postgresql://{DB_CONFIG['user']}:***@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}")
+            return True
         except Exception as e:
             logger.error(f"❌ Database Init Failed: {e}")
+            return False
 
     @staticmethod
     def _try_enable_pgvector(conn, cur) -> bool:
@@ -288,8 +427,8 @@ class Database:
     def execute(self, sql: str, params: tuple = ()) -> Any:
         """Execute SQL statement (INSERT/UPDATE/DELETE)"""
         # Auto-transpile SQLite ? placeholder to Postgres %s
-        pg_sql = sql.replace('?', '%s')
-        
+        pg_sql = _to_pg_sql(sql)
+
         conn = self._get_conn()
         try:
             cur = conn.cursor()
@@ -301,11 +440,28 @@ class Database:
             logger.error(f"SQL Error: {e} | SQL: {pg_sql} | Params: {params}")
             raise e
         finally:
-            conn.close()
+            self._release(conn)
+
+    def execute_returning(self, sql: str, params: tuple = ()) -> Optional[dict]:
+        """执行带 RETURNING 的写语句并提交，返回首行（一次往返完成写入与回读）"""
+        pg_sql = _to_pg_sql(sql)
+        conn = self._get_conn()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(pg_sql, params)
+            row = cur.fetchone()
+            conn.commit()
+            return dict(row) if row else None
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"SQL Error: {e} | SQL: {pg_sql} | Params: {params}")
+            raise e
+        finally:
+            self._release(conn)
 
     def fetch_all(self, sql: str, params: tuple = ()) -> list[dict]:
         """Fetch multiple rows"""
-        pg_sql = sql.replace('?', '%s')
+        pg_sql = _to_pg_sql(sql)
         conn = self._get_conn()
         try:
             cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -313,11 +469,61 @@ class Database:
             rows = cur.fetchall()
             return [dict(row) for row in rows]
         finally:
-            conn.close()
+            self._release(conn)
+
+    def iter_rows(self, sql: str, params: tuple = (), batch_size: int = 256) -> Iterator[dict]:
+        """
+        逐批读取结果（服务端命名游标 + fetchmany），不一次性物化整个结果集
+
+        生成器存活期间占用一个连接；调用方提前停止迭代（或生成器被回收）时归还。
+        """
+        pg_sql = _to_pg_sql(sql)
+        conn = self._get_conn()
+        try:
+            cur = conn.cursor(name=f"iter_{uuid4().hex}", cursor_factory=RealDictCursor)
+            cur.itersize = batch_size
+            cur.execute(pg_sql, params)
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    yield dict(row)
+            cur.close()
+        finally:
+            self._release(conn)
+
+    def execute_values(
+        self,
+        sql: str,
+        rows: list[tuple],
+        template: Optional[str] = None,
+        fetch: bool = False,
+    ) -> list[dict]:
+        """
+        多行批量写入（psycopg2 execute_values）
+
+        sql 中使用单个原生 `%s` 作为 VALUES 占位，template 同样使用原生占位符；
+        fetch=True 时返回 RETURNING 结果。
+        """
+        if not rows:
+            return []
+        conn = self._get_conn()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            result = execute_values(cur, sql, rows, template=template, fetch=fetch)
+            conn.commit()
+            return [dict(row) for row in result] if fetch else []
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"SQL Error: {e} | SQL: {sql} | Rows: {len(rows)}")
+            raise e
+        finally:
+            self._release(conn)
 
     def fetch_one(self, sql: str, params: tuple = ()) -> Optional[dict]:
         """Fetch single row"""
-        pg_sql = sql.replace('?', '%s')
+        pg_sql = _to_pg_sql(sql)
         conn = self._get_conn()
         try:
             cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -325,7 +531,7 @@ class Database:
             row = cur.fetchone()
             return dict(row) if row else None
         finally:
-            conn.close()
+            self._release(conn)
 
 # Global DB Instance
 db = Database()
@@ -4,11 +4,56 @@
 负责群聊相关的数据库操作
 """
 
-from typing import Optional, List
+from functools import lru_cache
+from typing import Optional, List, Tuple
 from uuid import uuid4
 
 from ..models import GroupChat, DiscussionMode
 from .base import BaseDAO
+from .member_dao import MEMBER_COLUMNS
+
+# 映射 GroupChat 所需的列（显式列出，表结构新增列不会被顺带读出）
+GROUP_COLUMNS = (
+    "id, name, created_at, manager_model, manager_thinking, manager_temperature, discussion_mode, "
+    "compression_threshold, memory_enabled, archive_enabled, retrieve_enabled, "
+    "scope_user_global, scope_group_local, scope_agent_local, "
+    "memory_injection_ratio, memory_top_n, memory_min_confidence, memory_score_threshold"
+)
+
+_GROUP_COLUMN_NAMES = tuple(col.strip() for col in GROUP_COLUMNS.split(","))
+_MEMBER_COLUMN_NAMES = tuple(col.strip() for col in MEMBER_COLUMNS.split(","))
+# 群聊列保持原名，成员列加 m_ 前缀避免与群聊列（id/name/created_at）冲突
+_GROUP_WITH_MEMBERS_SQL = (
+    "SELECT "
+    + ", ".join(f"g.{col}" for col in _GROUP_COLUMN_NAMES)
+    + ", "
+    + ", ".join(f"m.{col} AS m_{col}" for col in _MEMBER_COLUMN_NAMES)
+    + " FROM groups g LEFT JOIN members m ON m.group_id = g.id WHERE "
+)
+
+
+@lru_cache(maxsize=None)
+def _manager_update_sql(has_thinking: bool, has_temperature: bool) -> str:
+    """
+    管理员配置更新语句模板（最多 4 种组合）
+
+    值未变化时 UPDATE 的 WHERE 不命中，不产生写入；同一条语句顺带返回群聊是否存在，
+    调用方无需再查一次。
+    """
+    columns = ["manager_model"]
+    if has_thinking:
+        columns.append("manager_thinking")
+    if has_temperature:
+        columns.append("manager_temperature")
+    # manager_temperature 是 REAL 列：参数按 float8 传入，须先转成 real 再比较，否则 0.7 永远“不同”
+    placeholders = {col: "?::real" if col == "manager_temperature" else "?" for col in columns}
+    set_clause = ", ".join(f"{col} = {placeholders[col]}" for col in columns)
+    changed = " OR ".join(f"{col} IS DISTINCT FROM {placeholders[col]}" for col in columns)
+    return (
+        "WITH target AS (SELECT id FROM groups WHERE id = ?), "
+        f"updated AS (UPDATE groups SET {set_clause} WHERE id = ? AND ({changed}) RETURNING id) "
+        "SELECT EXISTS (SELECT 1 FROM target) AS found, EXISTS (SELECT 1 FROM updated) AS changed"
+    )
 
 
 class GroupDAO(BaseDAO):
@@ -20,56 +65,78 @@ class GroupDAO(BaseDAO):
     
     def _row_to_group(self, row: dict, members: List = None) -> GroupChat:
         """将数据库行转换为 GroupChat 对象"""
-        created_at = self.parse_datetime(row['created_at'])
-        
+        get = row.get  # 批量构建时的热循环，局部绑定减少属性查找
         return GroupChat(
             id=row['id'],
             name=row['name'],
-            created_at=created_at,
+            created_at=self.parse_datetime(row['created_at']),
             manager_model=row['manager_model'],
             manager_thinking=bool(row['manager_thinking']),
             manager_temperature=row['manager_temperature'],
-            discussion_mode=row.get('discussion_mode', DiscussionMode.FREE),
-            compression_threshold=row.get('compression_threshold', 0.8),
-            memory_enabled=bool(row.get('memory_enabled', True)),
-            archive_enabled=bool(row.get('archive_enabled', True)),
-            retrieve_enabled=bool(row.get('retrieve_enabled', True)),
-            scope_user_global=bool(row.get('scope_user_global', True)),
-            scope_group_local=bool(row.get('scope_group_local', True)),
-            scope_agent_local=bool(row.get('scope_agent_local', True)),
-            memory_injection_ratio=row.get('memory_injection_ratio', 0.2),
-            memory_top_n=row.get('memory_top_n', 5),
-            memory_min_confidence=row.get('memory_min_confidence', 0.75),
-            memory_score_threshold=row.get('memory_score_threshold', 0.35),
+            discussion_mode=get('discussion_mode', DiscussionMode.FREE),
+            compression_threshold=get('compression_threshold', 0.8),
+            memory_enabled=bool(get('memory_enabled', True)),
+            archive_enabled=bool(get('archive_enabled', True)),
+            retrieve_enabled=bool(get('retrieve_enabled', True)),
+            scope_user_global=bool(get('scope_user_global', True)),
+            scope_group_local=bool(get('scope_group_local', True)),
+            scope_agent_local=bool(get('scope_agent_local', True)),
+            memory_injection_ratio=get('memory_injection_ratio', 0.2),
+            memory_top_n=get('memory_top_n', 5),
+            memory_min_confidence=get('memory_min_confidence', 0.75),
+            memory_score_threshold=get('memory_score_threshold', 0.35),
             members=members or []
         )
     
     def get_by_id(self, group_id: str) -> Optional[dict]:
         """根据 ID 获取群聊原始数据"""
-        return self.db.fetch_one("SELECT * FROM groups WHERE id = ?", (group_id,))
+        return self.db.fetch_one(f"SELECT {GROUP_COLUMNS} FROM groups WHERE id = ?", (group_id,))
     
     def get_by_name(self, name: str) -> Optional[dict]:
         """根据名称获取群聊原始数据"""
-        return self.db.fetch_one("SELECT * FROM groups WHERE name = ?", (name,))
+        return self.db.fetch_one(f"SELECT {GROUP_COLUMNS} FROM groups WHERE name = ?", (name,))
+    
+    def get_with_members(self, *, group_id: str = None, name: str = None) -> Tuple[Optional[dict], List[dict]]:
+        """
+        一次 LEFT JOIN 同时取群聊与其成员（按 id 或名称）
+
+        Returns:
+            (群聊原始数据, 成员原始数据列表)；群聊不存在时为 (None, [])
+        """
+        if group_id is not None:
+            rows = self.db.fetch_all(_GROUP_WITH_MEMBERS_SQL + "g.id = ?", (group_id,))
+        else:
+            rows = self.db.fetch_all(_GROUP_WITH_MEMBERS_SQL + "g.name = ?", (name,))
+        if not rows:
+            return None, []
+        first = rows[0]
+        group_row = {col: first[col] for col in _GROUP_COLUMN_NAMES}
+        # 同名群聊理论上可能有多个：与单表查询一致，只取第一个群的成员
+        member_rows = [
+            {col: row[f"m_{col}"] for col in _MEMBER_COLUMN_NAMES}
+            for row in rows
+            if row["m_id"] is not None and row["id"] == group_row["id"]
+        ]
+        return group_row, member_rows
     
     def list_all(self) -> List[dict]:
         """获取所有群聊的原始数据"""
-        return self.db.fetch_all("SELECT * FROM groups ORDER BY created_at DESC")
+        return self.db.fetch_all(f"SELECT {GROUP_COLUMNS} FROM groups ORDER BY created_at DESC")
     
     def create(self, name: str, discussion_mode: str = 'free',
-               manager_model: str = "gpt-4o-mini") -> str:
+               manager_model: str = "gpt-4o-mini") -> dict:
         """
         创建群聊
         
         Returns:
-            新创建的群聊 ID
+            新群聊的完整行（INSERT ... RETURNING，含各列默认值）
         """
         group_id = str(uuid4())
-        self.db.execute("""
+        return self.db.execute_returning(f"""
             INSERT INTO groups (id, name, discussion_mode, manager_model)
             VALUES (?, ?, ?, ?)
+            RETURNING {GROUP_COLUMNS}
         """, (group_id, name, discussion_mode, manager_model))
-        return group_id
     
     def delete(self, group_id: str) -> bool:
         """删除群聊"""
@@ -78,24 +145,24 @@ class GroupDAO(BaseDAO):
     
     def update_manager_config(self, group_id: str, model_id: str,
                               thinking: Optional[bool] = None,
-                              temperature: Optional[float] = None) -> bool:
-        """更新群聊管理员配置"""
-        update_fields = ["manager_model = ?"]
-        params = [model_id]
+                              temperature: Optional[float] = None) -> Tuple[bool, bool]:
+        """
+        更新群聊管理员配置
+        
+        配置与当前值完全相同时不执行写入（不产生新行版本、不加行锁）。
         
+        Returns:
+            (群聊是否存在, 是否有写入)
+        """
+        values = (model_id,)
         if thinking is not None:
-            update_fields.append("manager_thinking = ?")
-            params.append(bool(thinking))
+            values += (bool(thinking),)
         if temperature is not None:
-            update_fields.append("manager_temperature = ?")
-            params.append(temperature)
+            values += (temperature,)
         
-        params.append(group_id)
-        cursor = self.db.execute(
-            f"UPDATE groups SET {', '.join(update_fields)} WHERE id = ?",
-            tuple(params)
-        )
-        return cursor.rowcount > 0
+        sql = _manager_update_sql(thinking is not None, temperature is not None)
+        row = self.db.execute_returning(sql, (group_id,) + values + (group_id,) + values)
+        return bool(row["found"]), bool(row["changed"])
 
     def update_compression_threshold(self, group_id: str, threshold: float) -> bool:
         """更新群聊压缩阈值"""
@@ -4,7 +4,9 @@
 负责长期记忆、归档游标、审计与死信表的数据访问。
 """
 
-import json
+import threading
+import time
+from collections import Counter
 from typing import Optional
 from uuid import uuid4
 
@@ -12,16 +14,95 @@ from loguru import logger
 
 from .base import BaseDAO
 
+# 与 idx_ltm_fingerprint_scope 唯一索引一致的冲突目标
+_UPSERT_CONFLICT_TARGET = """
+    (scope, user_id, COALESCE(group_id, ''), COALESCE(member_id, ''), COALESCE(persona_version, ''), fingerprint)
+"""
+
+_UPSERT_BATCH_SQL = """
+    INSERT INTO long_term_memories (
+        id, group_id, user_id, member_id, scope, memory_type, content,
+        confidence, fingerprint, persona_version, source_message_id,
+        source_created_at, expires_at, metadata
+    )
+    VALUES %s
+    ON CONFLICT """ + _UPSERT_CONFLICT_TARGET + """
+    DO UPDATE SET
+        content = EXCLUDED.content,
+        confidence = EXCLUDED.confidence,
+        source_message_id = EXCLUDED.source_message_id,
+        source_created_at = EXCLUDED.source_created_at,
+        expires_at = EXCLUDED.expires_at,
+        metadata = EXCLUDED.metadata,
+        is_active = TRUE,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING id, scope, user_id, group_id, member_id, persona_version, fingerprint
+"""
+
+_UPSERT_BATCH_VECTOR_SQL = """
+    INSERT INTO long_term_memories (
+        id, group_id, user_id, member_id, scope, memory_type, content,
+        confidence, fingerprint, persona_version, source_message_id,
+        source_created_at, expires_at, metadata, embedding, embedding_model, embedding_updated_at
+    )
+    VALUES %s
+    ON CONFLICT """ + _UPSERT_CONFLICT_TARGET + """
+    DO UPDATE SET
+        content = EXCLUDED.content,
+        confidence = EXCLUDED.confidence,
+        source_message_id = EXCLUDED.source_message_id,
+        source_created_at = EXCLUDED.source_created_at,
+        expires_at = EXCLUDED.expires_at,
+        metadata = EXCLUDED.metadata,
+        embedding = EXCLUDED.embedding,
+        embedding_model = EXCLUDED.embedding_model,
+        embedding_updated_at = CURRENT_TIMESTAMP,
+        is_active = TRUE,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING id, scope, user_id, group_id, member_id, persona_version, fingerprint
+"""
+
+# 检索候选只取打分/注入需要的列，不回传 embedding 向量本身
+_CANDIDATE_COLUMNS = """
+    id, group_id, user_id, member_id, scope, memory_type, content, confidence,
+    fingerprint, persona_version, source_message_id, source_created_at, expires_at,
+    metadata, is_active, decay_score, last_used_at, created_at, updated_at
+"""
+
+_UPSERT_BATCH_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+_UPSERT_BATCH_VECTOR_TEMPLATE = (
+    "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::vector, %s, CURRENT_TIMESTAMP)"
+)
+
 
 class LongTermMemoryDAO(BaseDAO):
     """长期记忆数据访问对象"""
 
+    # 命中记录进程内合并：累计到一定数量或超过时间窗口后批量落库
+    TOUCH_FLUSH_INTERVAL = 5.0  # 秒
+    TOUCH_FLUSH_MAX_IDS = 200
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.vector_available = self._detect_vector_available()
+        self._pending_touches: Counter = Counter()
+        self._touch_lock = threading.Lock()
+        self._last_touch_flush = time.monotonic()
+
+    # 探测结果按数据库实例缓存；探测异常（如启动期数据库未就绪）不缓存，下次访问重试
+    _vector_probe_cache: dict = {}
 
-    def _detect_vector_available(self) -> bool:
-        """检测当前数据库是否可用 pgvector + embedding 列"""
+    @property
+    def vector_available(self) -> bool:
+        """pgvector + embedding 列是否可用（首次访问时惰性探测）"""
+        cached = LongTermMemoryDAO._vector_probe_cache.get(self.db)
+        if cached is None:
+            cached = self._detect_vector_available()
+            if cached is not None:
+                LongTermMemoryDAO._vector_probe_cache[self.db] = cached
+        return bool(cached)
+
+    def _detect_vector_available(self) -> Optional[bool]:
+        """检测当前数据库是否可用 pgvector + embedding 列（异常时返回 None）"""
         try:
             row = self.db.fetch_one(
                 """
@@ -40,161 +121,78 @@ class LongTermMemoryDAO(BaseDAO):
                 logger.warning("⚠️ LongTermMemoryDAO: embedding 列不可用，降级为非向量检索")
             return has_col
         except Exception as e:
-            logger.warning(f"⚠️ LongTermMemoryDAO: 检测 pgvector 失败，降级非向量检索: {e}")
-            return False
+            logger.warning(f"⚠️ LongTermMemoryDAO: 检测 pgvector 失败，暂按非向量检索处理: {e}")
+            return None
 
     # ===== 记忆主表 =====
 
-    def _find_duplicate(
-        self,
-        scope: str,
-        user_id: str,
-        group_id: str | None,
-        member_id: str | None,
-        persona_version: str | None,
-        fingerprint: str,
-    ) -> Optional[dict]:
-        sql = """
-            SELECT * FROM long_term_memories
-            WHERE scope = ?
-              AND user_id = ?
-              AND COALESCE(group_id, '') = COALESCE(?, '')
-              AND COALESCE(member_id, '') = COALESCE(?, '')
-              AND COALESCE(persona_version, '') = COALESCE(?, '')
-              AND fingerprint = ?
-            LIMIT 1
-        """
-        return self.db.fetch_one(sql, (scope, user_id, group_id, member_id, persona_version, fingerprint))
-
     def upsert_memory(self, record: dict) -> str:
-        """按作用域 + fingerprint 幂等写入长期记忆"""
-        duplicate = self._find_duplicate(
-            scope=record["scope"],
-            user_id=record["user_id"],
-            group_id=record.get("group_id"),
-            member_id=record.get("member_id"),
-            persona_version=record.get("persona_version"),
-            fingerprint=record["fingerprint"],
+        """按作用域 + fingerprint 幂等写入长期记忆（单条 UPSERT，冲突时原地更新）"""
+        return self.upsert_memory_batch([record])[0]
+
+    @staticmethod
+    def _unique_key(record: dict) -> tuple:
+        """与唯一索引一致的幂等键"""
+        return (
+            record["scope"],
+            record["user_id"],
+            record.get("group_id") or "",
+            record.get("member_id") or "",
+            record.get("persona_version") or "",
+            record["fingerprint"],
         )
-        metadata = record.get("metadata")
-        metadata_json = json.dumps(metadata, ensure_ascii=False) if metadata else None
-        embedding_literal = record.get("embedding")
-        embedding_model = record.get("embedding_model")
 
-        if duplicate:
+    def upsert_memory_batch(self, records: list[dict]) -> list[str]:
+        """
+        批量幂等写入长期记忆（单条多行 INSERT ... ON CONFLICT）
+
+        返回与 records 一一对应的 memory id。
+        """
+        if not records:
+            return []
+
+        # 同一批次内相同唯一键只保留最后一条，避免 ON CONFLICT 重复更新同一行
+        keys = [self._unique_key(record) for record in records]
+        latest: dict[tuple, dict] = {}
+        for key, record in zip(keys, records):
+            latest[key] = record
+
+        vector_rows: list[tuple] = []
+        plain_rows: list[tuple] = []
+        for record in latest.values():
+            metadata = record.get("metadata")
+            params = (
+                str(uuid4()),
+                record.get("group_id"),
+                record["user_id"],
+                record.get("member_id"),
+                record["scope"],
+                record.get("memory_type", "discussion_asset"),
+                record["content"],
+                record.get("confidence", 0.8),
+                record["fingerprint"],
+                record.get("persona_version"),
+                record.get("source_message_id"),
+                record.get("source_created_at"),
+                record.get("expires_at"),
+                self.dumps_json(metadata) if metadata else None,
+            )
+            embedding_literal = record.get("embedding")
             if self.vector_available and embedding_literal:
-                self.db.execute(
-                    """
-                    UPDATE long_term_memories
-                    SET content = ?,
-                        confidence = ?,
-                        source_message_id = ?,
-                        source_created_at = ?,
-                        expires_at = ?,
-                        metadata = ?,
-                        embedding = ?::vector,
-                        embedding_model = ?,
-                        embedding_updated_at = CURRENT_TIMESTAMP,
-                        is_active = TRUE,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                    """,
-                    (
-                        record["content"],
-                        record.get("confidence", 0.8),
-                        record.get("source_message_id"),
-                        record.get("source_created_at"),
-                        record.get("expires_at"),
-                        metadata_json,
-                        embedding_literal,
-                        embedding_model,
-                        duplicate["id"],
-                    ),
-                )
+                vector_rows.append(params + (embedding_literal, record.get("embedding_model")))
             else:
-                self.db.execute(
-                    """
-                    UPDATE long_term_memories
-                    SET content = ?,
-                        confidence = ?,
-                        source_message_id = ?,
-                        source_created_at = ?,
-                        expires_at = ?,
-                        metadata = ?,
-                        is_active = TRUE,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                    """,
-                    (
-                        record["content"],
-                        record.get("confidence", 0.8),
-                        record.get("source_message_id"),
-                        record.get("source_created_at"),
-                        record.get("expires_at"),
-                        metadata_json,
-                        duplicate["id"],
-                    ),
-                )
-            return duplicate["id"]
-
-        memory_id = str(uuid4())
-        if self.vector_available and embedding_literal:
-            self.db.execute(
-                """
-                INSERT INTO long_term_memories (
-                    id, group_id, user_id, member_id, scope, memory_type, content,
-                    confidence, fingerprint, persona_version, source_message_id,
-                    source_created_at, expires_at, metadata, embedding, embedding_model, embedding_updated_at
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?::vector, ?, CURRENT_TIMESTAMP)
-                """,
-                (
-                    memory_id,
-                    record.get("group_id"),
-                    record["user_id"],
-                    record.get("member_id"),
-                    record["scope"],
-                    record.get("memory_type", "discussion_asset"),
-                    record["content"],
-                    record.get("confidence", 0.8),
-                    record["fingerprint"],
-                    record.get("persona_version"),
-                    record.get("source_message_id"),
-                    record.get("source_created_at"),
-                    record.get("expires_at"),
-                    metadata_json,
-                    embedding_literal,
-                    embedding_model,
-                ),
-            )
-        else:
-            self.db.execute(
-                """
-                INSERT INTO long_term_memories (
-                    id, group_id, user_id, member_id, scope, memory_type, content,
-                    confidence, fingerprint, persona_version, source_message_id,
-                    source_created_at, expires_at, metadata
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    memory_id,
-                    record.get("group_id"),
-                    record["user_id"],
-                    record.get("member_id"),
-                    record["scope"],
-                    record.get("memory_type", "discussion_asset"),
-                    record["content"],
-                    record.get("confidence", 0.8),
-                    record["fingerprint"],
-                    record.get("persona_version"),
-                    record.get("source_message_id"),
-                    record.get("source_created_at"),
-                    record.get("expires_at"),
-                    metadata_json,
-                ),
-            )
-        return memory_id
+                plain_rows.append(params)
+
+        ids_by_key: dict[tuple, str] = {}
+        for sql, template, rows in (
+            (_UPSERT_BATCH_VECTOR_SQL, _UPSERT_BATCH_VECTOR_TEMPLATE, vector_rows),
+            (_UPSERT_BATCH_SQL, _UPSERT_BATCH_TEMPLATE, plain_rows),
+        ):
+            if not rows:
+                continue
+            for row in self.db.execute_values(sql, rows, template=template, fetch=True):
+                ids_by_key[self._unique_key(row)] = row["id"]
+        return [ids_by_key[key] for key in keys]
 
     def list_candidates(
         self,
@@ -206,12 +204,13 @@ class LongTermMemoryDAO(BaseDAO):
         persona_version: str | None = None,
         min_confidence: float = 0.0,
         query_embedding: str | None = None,
+        memory_types: list[str] | None = None,
         limit: int = 20,
     ) -> list[dict]:
-        """按作用域读取候选长期记忆（仅返回可用数据）"""
+        """按作用域读取候选长期记忆（仅返回可用数据；memory_types 需已转小写）"""
         if self.vector_available and query_embedding:
-            sql = """
-            SELECT *,
+            sql = f"""
+            SELECT {_CANDIDATE_COLUMNS},
                    COALESCE(1 - (embedding <=> ?::vector), 0) AS vector_score
             FROM long_term_memories
             WHERE scope = ?
@@ -222,8 +221,8 @@ class LongTermMemoryDAO(BaseDAO):
             """
             params: list = [query_embedding, scope, user_id, min_confidence]
         else:
-            sql = """
-            SELECT *, 0::REAL AS vector_score
+            sql = f"""
+            SELECT {_CANDIDATE_COLUMNS}, 0::REAL AS vector_score
             FROM long_term_memories
             WHERE scope = ?
               AND user_id = ?
@@ -242,6 +241,9 @@ class LongTermMemoryDAO(BaseDAO):
         if persona_version is not None:
             sql += " AND COALESCE(persona_version, '') = COALESCE(?, '')"
             params.append(persona_version)
+        if memory_types:
+            sql += " AND LOWER(TRIM(memory_type)) = ANY(?)"
+            params.append(list(memory_types))
 
         if self.vector_available and query_embedding:
             sql += " ORDER BY vector_score DESC, updated_at DESC LIMIT ?"
@@ -250,18 +252,65 @@ class LongTermMemoryDAO(BaseDAO):
         params.append(limit)
         return self.db.fetch_all(sql, tuple(params))
 
+    def get_embeddings_by_fingerprint(self, model: str, fingerprints: list[str]) -> dict[str, str]:
+        """按内容指纹复用同一模型下已生成的 embedding，返回 fingerprint -> pgvector 文本"""
+        if not fingerprints or not model or not self.vector_available:
+            return {}
+        rows = self.db.fetch_all(
+            """
+            SELECT DISTINCT ON (fingerprint) fingerprint, embedding::text AS embedding
+            FROM long_term_memories
+            WHERE fingerprint = ANY(?)
+              AND embedding_model = ?
+              AND embedding IS NOT NULL
+            ORDER BY fingerprint, embedding_updated_at DESC NULLS LAST
+            """,
+            (list(fingerprints), model),
+        )
+        return {row["fingerprint"]: row["embedding"] for row in rows}
+
     def touch_used(self, memory_ids: list[str]) -> None:
-        """更新命中记忆的使用时间和衰减分"""
+        """记录命中记忆（进程内合并，按数量/时间窗口批量更新使用时间和衰减分）"""
         if not memory_ids:
             return
-        sql = """
-            UPDATE long_term_memories
-            SET last_used_at = CURRENT_TIMESTAMP,
-                decay_score = LEAST(COALESCE(decay_score, 1.0) + 0.05, 1.0)
-            WHERE id = ANY(%s)
-        """
-        # 这里直接使用 execute 的原生 postgres 占位符能力
-        self.db.execute(sql, (memory_ids,))
+        with self._touch_lock:
+            self._pending_touches.update(memory_ids)
+            due = (
+                len(self._pending_touches) >= self.TOUCH_FLUSH_MAX_IDS
+                or time.monotonic() - self._last_touch_flush >= self.TOUCH_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush_touches()
+
+    def flush_touches(self) -> int:
+        """将缓冲的命中记录一次性落库，返回更新的记忆数"""
+        with self._touch_lock:
+            pending = self._pending_touches
+            self._pending_touches = Counter()
+            self._last_touch_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        ids = list(pending)
+        hits = [pending[memory_id] for memory_id in ids]
+        try:
+            self.db.execute(
+                """
+                UPDATE long_term_memories AS ltm
+                SET last_used_at = CURRENT_TIMESTAMP,
+                    decay_score = LEAST(COALESCE(ltm.decay_score, 1.0) + 0.05 * hits.cnt, 1.0)
+                FROM unnest(?::text[], ?::int[]) AS hits(id, cnt)
+                WHERE ltm.id = hits.id
+                """,
+                (ids, hits),
+            )
+        except Exception as e:
+            # 落库失败时放回缓冲，等待下次 flush 重试
+            with self._touch_lock:
+                self._pending_touches.update(pending)
+            logger.warning(f"⚠️ 记忆命中记录落库失败，稍后重试: {e}")
+            return 0
+        return len(ids)
 
     # ===== 归档游标 =====
 
@@ -296,7 +345,7 @@ class LongTermMemoryDAO(BaseDAO):
             INSERT INTO memory_dead_letters (group_id, user_id, error, payload, retry_count)
             VALUES (?, ?, ?, ?, ?)
             """,
-            (group_id, user_id, error, json.dumps(payload, ensure_ascii=False), retry_count),
+            (group_id, user_id, error, self.dumps_json(payload), retry_count),
         )
 
     def add_audit_log(
@@ -310,51 +359,42 @@ class LongTermMemoryDAO(BaseDAO):
         memory_ids: list[str] | None = None,
         detail: str | None = None,
     ) -> None:
-        memory_ids_text = ",".join(memory_ids or [])
         self.db.execute(
             """
             INSERT INTO memory_audit_logs (request_id, group_id, user_id, event_type, scope, memory_ids, detail)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
-            (request_id, group_id, user_id, event_type, scope, memory_ids_text, detail),
+            (request_id, group_id, user_id, event_type, scope, list(memory_ids or []), detail),
         )
 
     def get_group_stats(self, group_id: str) -> dict:
-        scope_rows = self.db.fetch_all(
-            """
-            SELECT scope, COUNT(*) AS cnt
-            FROM long_term_memories
-            WHERE group_id = ?
-              AND is_active = TRUE
-            GROUP BY scope
-            """,
-            (group_id,),
-        )
-        dead_row = self.db.fetch_one(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM memory_dead_letters
-            WHERE group_id = ?
-            """,
-            (group_id,),
-        )
-        scope_counts = {row["scope"]: int(row["cnt"]) for row in scope_rows}
-        vec_row = self.db.fetch_one(
-            """
-            SELECT COUNT(*) AS cnt
-            FROM long_term_memories
-            WHERE group_id = ?
-              AND is_active = TRUE
-              AND embedding IS NOT NULL
+        """单次查询汇总群组的记忆分布、向量化条数与死信数"""
+        has_emb = "embedding IS NOT NULL" if self.vector_available else "FALSE"
+        row = self.db.fetch_one(
+            f"""
+            WITH ltm AS (
+                SELECT scope, {has_emb} AS has_emb
+                FROM long_term_memories
+                WHERE group_id = ?
+                  AND is_active = TRUE
+            )
+            SELECT
+                (
+                    SELECT COALESCE(jsonb_object_agg(scope, cnt), '{{}}'::jsonb)
+                    FROM (SELECT scope, COUNT(*) AS cnt FROM ltm GROUP BY scope) AS s
+                ) AS scope_counts,
+                (SELECT COUNT(*) FROM ltm WHERE has_emb) AS embedded_count,
+                (SELECT COUNT(*) FROM memory_dead_letters WHERE group_id = ?) AS dead_letter_count
             """,
-            (group_id,),
-        ) if self.vector_available else {"cnt": 0}
+            (group_id, group_id),
+        ) or {}
+        scope_counts = {scope: int(cnt) for scope, cnt in (row.get("scope_counts") or {}).items()}
         return {
             "scope_counts": scope_counts,
-            "dead_letter_count": int((dead_row or {}).get("cnt", 0)),
+            "dead_letter_count": int(row.get("dead_letter_count") or 0),
             "total_records": int(sum(scope_counts.values())),
             "vector_enabled": bool(self.vector_available),
-            "embedded_records": int((vec_row or {}).get("cnt", 0)),
+            "embedded_records": int(row.get("embedded_count") or 0),
         }
 
 
@@ -4,12 +4,25 @@
 负责 AI 成员相关的数据库操作
 """
 
-from typing import Optional, List
+from functools import lru_cache
+from typing import Optional, List, Tuple
 from uuid import uuid4
 
 from ..models import AIMember, AIMemberCreate, AIMemberUpdate
 from .base import BaseDAO
 
+# 映射 AIMember 所需的列（显式列出，表结构新增列不会被顺带读出）
+MEMBER_COLUMNS = "id, group_id, name, model_id, description, persona, thinking, temperature"
+
+_MEMBER_UPDATABLE = ("description", "thinking", "temperature")
+
+
+@lru_cache(maxsize=None)
+def _member_update_sql(present: Tuple[bool, bool, bool]) -> str:
+    """成员更新语句模板（present 标记 _MEMBER_UPDATABLE 中哪些列需要更新）"""
+    set_clause = ", ".join(f"{col} = ?" for col, has in zip(_MEMBER_UPDATABLE, present) if has)
+    return f"UPDATE members SET {set_clause} WHERE id = ? AND group_id = ? RETURNING {MEMBER_COLUMNS}"
+
 
 class MemberDAO(BaseDAO):
     """
@@ -19,8 +32,8 @@ class MemberDAO(BaseDAO):
     """
     
     def _row_to_member(self, row: dict) -> AIMember:
-        """将数据库行转换为 AIMember 对象"""
-        return AIMember(
+        """将数据库行转换为 AIMember 对象（行数据可信，跳过 pydantic 校验）"""
+        return AIMember.model_construct(
             id=row['id'],
             name=row['name'],
             model_id=row['model_id'],
@@ -32,69 +45,75 @@ class MemberDAO(BaseDAO):
     
     def get_by_id(self, member_id: str) -> Optional[dict]:
         """根据 ID 获取成员原始数据"""
-        return self.db.fetch_one("SELECT * FROM members WHERE id = ?", (member_id,))
+        return self.db.fetch_one(f"SELECT {MEMBER_COLUMNS} FROM members WHERE id = ?", (member_id,))
     
     def get_by_group(self, group_id: str) -> List[dict]:
         """获取群聊的所有成员原始数据"""
-        return self.db.fetch_all("SELECT * FROM members WHERE group_id = ?", (group_id,))
+        return self.db.fetch_all(f"SELECT {MEMBER_COLUMNS} FROM members WHERE group_id = ?", (group_id,))
     
-    def add(self, group_id: str, data: AIMemberCreate) -> str:
+    def get_by_groups(self, group_ids: List[str]) -> List[dict]:
+        """一次获取多个群聊的成员原始数据（行内带 group_id，由调用方分组）"""
+        if not group_ids:
+            return []
+        return self.db.fetch_all(f"SELECT {MEMBER_COLUMNS} FROM members WHERE group_id = ANY(?)", (list(group_ids),))
+    
+    def add(self, group_id: str, data: AIMemberCreate) -> dict:
         """
         添加成员
         
         Returns:
-            新成员的 ID
+            新成员的完整行（INSERT ... RETURNING，无需再查一次）
         """
         member_id = str(uuid4())
-        self.db.execute("""
+        return self.db.execute_returning(f"""
             INSERT INTO members (id, group_id, name, model_id, description, thinking, temperature)
             VALUES (?, ?, ?, ?, ?, ?, ?)
+            RETURNING {MEMBER_COLUMNS}
         """, (
             member_id, group_id, data.model_id, data.model_id, data.description,
             bool(data.thinking), data.temperature
         ))
-        return member_id
     
-    def add_raw(self, group_id: str, name: str, model_id: str,
-                description: str, thinking: bool, temperature: float) -> str:
+    def add_raw_many(self, group_id: str, members: List[dict]) -> List[str]:
         """
-        添加成员（原始参数版本，用于预设数据）
+        批量添加成员（原始参数版本，用于预设数据），一条多行 INSERT、一个事务
+        
+        members 每项包含 name/model_id，可选 description/thinking/temperature。
         
         Returns:
-            新成员的 ID
+            新成员的 ID 列表（与 members 顺序一致）
         """
-        member_id = str(uuid4())
-        self.db.execute("""
+        rows = [
+            (
+                str(uuid4()), group_id, m['name'], m['model_id'], m.get('description'),
+                bool(m.get('thinking', False)), m.get('temperature', 0.7),
+            )
+            for m in members
+        ]
+        self.db.execute_values(
+            """
             INSERT INTO members (id, group_id, name, model_id, description, thinking, temperature)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            member_id, group_id, name, model_id, description,
-            bool(thinking), temperature
-        ))
-        return member_id
+            VALUES %s
+            """,
+            rows,
+        )
+        return [row[0] for row in rows]
     
-    def update(self, group_id: str, member_id: str, data: AIMemberUpdate) -> bool:
-        """更新成员信息"""
-        fields = []
-        params = []
-        
-        if data.description is not None:
-            fields.append("description = ?")
-            params.append(data.description)
-        if data.thinking is not None:
-            fields.append("thinking = ?")
-            params.append(bool(data.thinking))
-        if data.temperature is not None:
-            fields.append("temperature = ?")
-            params.append(data.temperature)
+    def update(self, group_id: str, member_id: str, data: AIMemberUpdate) -> Optional[dict]:
+        """
+        更新成员信息
         
-        if not fields:
-            return False
+        Returns:
+            更新后的完整行（UPDATE ... RETURNING）；没有可更新字段或成员不存在时返回 None
+        """
+        # 按"哪些字段有值"取缓存的 SQL 模板（最多 2^3 种组合），不再每次拼接
+        present = (data.description is not None, data.thinking is not None, data.temperature is not None)
+        if not any(present):
+            return None
         
-        params.extend([member_id, group_id])
-        sql = f"UPDATE members SET {', '.join(fields)} WHERE id = ? AND group_id = ?"
-        cursor = self.db.execute(sql, tuple(params))
-        return cursor.rowcount > 0
+        values = (data.description, None if data.thinking is None else bool(data.thinking), data.temperature)
+        params = tuple(v for v, has in zip(values, present) if has) + (member_id, group_id)
+        return self.db.execute_returning(_member_update_sql(present), params)
     
     def delete(self, group_id: str, member_id: str) -> bool:
         """删除成员"""
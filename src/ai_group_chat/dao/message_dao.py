@@ -4,12 +4,23 @@
 负责消息相关的数据库操作
 """
 
-from typing import Optional, List
+from typing import Iterator, Optional, List
 from uuid import uuid4
 
-from ..models import Message, MessageRole, MessageType
+from ..models import DiscussionMode, Message, MessageRole, MessageType
 from .base import BaseDAO
 
+# 映射 Message 所需的列（显式列出，表结构新增列不会被顺带读出）
+MESSAGE_COLUMNS = (
+    "id, group_id, role, content, sender_id, user_id, sender_name, mode, created_at, "
+    "message_type, is_compressed, original_content, value_score"
+)
+
+_MESSAGE_TYPES = MessageType._value2member_map_
+_MESSAGE_ROLES = MessageRole._value2member_map_
+_DISCUSSION_MODES = DiscussionMode._value2member_map_
+_parse_datetime = BaseDAO.parse_datetime
+
 
 class MessageDAO(BaseDAO):
     """
@@ -19,35 +30,64 @@ class MessageDAO(BaseDAO):
     """
     
     def _row_to_message(self, row: dict) -> Message:
-        """将数据库行转换为 Message 对象"""
-        created_at = self.parse_datetime(row['created_at'])
+        """
+        将数据库行转换为 Message 对象
+        
+        行数据来自自有表结构，字段类型可信：枚举与时间在这里归一化后
+        直接 model_construct，跳过逐字段校验（批量加载历史时开销明显）。
+        """
+        get = row.get  # 加载历史时逐行调用，局部绑定减少属性查找
         
-        # 处理 message_type 字段
-        msg_type_str = row.get('message_type', 'normal')
-        try:
-            msg_type = MessageType(msg_type_str) if msg_type_str else MessageType.NORMAL
-        except ValueError:
-            msg_type = MessageType.NORMAL
+        # 字符串 -> 枚举直接查枚举自带的 value 映射表，未知/空值回落 NORMAL
+        msg_type = _MESSAGE_TYPES.get(get('message_type'), MessageType.NORMAL)
         
-        return Message(
+        mode = row['mode']
+        return Message.model_construct(
             id=row['id'],
             group_id=row['group_id'],
-            role=row['role'],
+            role=_MESSAGE_ROLES[row['role']],
             content=row['content'],
-            sender_id=row.get('sender_id'),
-            user_id=row.get('user_id', 'default-user'),
+            sender_id=get('sender_id'),
+            user_id=get('user_id', 'default-user'),
             sender_name=row['sender_name'],
-            mode=row['mode'],
-            created_at=created_at,
+            mode=_DISCUSSION_MODES[mode] if mode else None,
+            created_at=_parse_datetime(row['created_at']),
             message_type=msg_type,
-            is_compressed=bool(row.get('is_compressed', False)),
-            original_content=row.get('original_content'),
-            value_score=row.get('value_score'),
+            is_compressed=bool(get('is_compressed', False)),
+            original_content=get('original_content'),
+            value_score=get('value_score'),
         )
     
+    def _row_to_payload(self, row: dict) -> dict:
+        """
+        将数据库行直接转换为与 Message 序列化结果一致的 JSON 字典（只读接口用，不构造模型）
+        """
+        get = row.get
+        message_type = get('message_type')
+        return {
+            'id': row['id'],
+            'group_id': row['group_id'],
+            'role': row['role'],
+            'content': row['content'],
+            'sender_id': get('sender_id'),
+            'user_id': get('user_id', 'default-user'),
+            'sender_name': row['sender_name'],
+            'mode': row['mode'] or None,
+            'created_at': _parse_datetime(row['created_at']).isoformat(),
+            'message_type': message_type if message_type in _MESSAGE_TYPES else MessageType.NORMAL.value,
+            'is_compressed': bool(get('is_compressed', False)),
+            'original_content': get('original_content'),
+            'value_score': get('value_score'),
+        }
+    
+    def dump_by_group_json(self, group_id: str, limit: int = 50) -> bytes:
+        """按 get_by_group 的语义读取消息并直接序列化为 JSON 字节"""
+        rows = self.get_by_group(group_id, limit)
+        return self.dumps_json_bytes([self._row_to_payload(row) for row in rows])
+    
     def get_by_id(self, message_id: str) -> Optional[dict]:
         """根据 ID 获取消息原始数据"""
-        return self.db.fetch_one("SELECT * FROM messages WHERE id = ?", (message_id,))
+        return self.db.fetch_one(f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE id = ?", (message_id,))
     
     def get_by_group(self, group_id: str, limit: int = 50) -> List[dict]:
         """
@@ -57,22 +97,27 @@ class MessageDAO(BaseDAO):
         如果 limit <= 0: 获取所有消息
         """
         if limit > 0:
-            sql = """
-                SELECT * FROM (
-                    SELECT * FROM messages 
-                    WHERE group_id = ? 
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                ) AS recent_msgs ORDER BY created_at ASC
-            """
-            return self.db.fetch_all(sql, (group_id, limit))
-        else:
-            sql = """
-                SELECT * FROM messages 
+            # 索引 (group_id, created_at, id) 反向扫描取最新 N 条，再在内存里翻转为升序
+            sql = f"""
+                SELECT {MESSAGE_COLUMNS} FROM messages 
                 WHERE group_id = ? 
-                ORDER BY created_at ASC
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
             """
-            return self.db.fetch_all(sql, (group_id,))
+            rows = self.db.fetch_all(sql, (group_id, limit))
+            rows.reverse()
+            return rows
+        else:
+            return list(self.iter_by_group(group_id))
+    
+    def iter_by_group(self, group_id: str, batch_size: int = 256) -> Iterator[dict]:
+        """按时间升序逐批读取群聊的全部消息（长历史不必一次性载入内存）"""
+        sql = f"""
+            SELECT {MESSAGE_COLUMNS} FROM messages 
+            WHERE group_id = ? 
+            ORDER BY created_at ASC, id ASC
+        """
+        return self.db.iter_rows(sql, (group_id,), batch_size=batch_size)
             
     def get_messages_after(self, group_id: str, last_message_id: str) -> List[dict]:
         """
@@ -80,39 +125,87 @@ class MessageDAO(BaseDAO):
         
         用于配合上下文快照，只加载上次快照之后的新消息。
         """
-        # 1. 获取 last_message 的 created_at
-        last_msg = self.get_by_id(last_message_id)
-        if not last_msg:
-            # 如果找不到参照消息（可能被物理删除了），则回退到全量加载
-            return self.get_by_group(group_id, limit=0)
-            
-        last_created_at = last_msg['created_at']
-        
-        # 2. 查询之后的 msg
-        sql = """
-            SELECT * FROM messages 
-            WHERE group_id = ? AND created_at > ?
-            ORDER BY created_at ASC
+        # 参照消息不存在（可能被物理删除）时子查询为 NULL，回退为全量加载
+        sql = f"""
+            SELECT {MESSAGE_COLUMNS} FROM messages 
+            WHERE group_id = ?
+              AND created_at > COALESCE(
+                    (SELECT created_at FROM messages WHERE id = ?),
+                    '-infinity'::timestamp
+                  )
+            ORDER BY created_at ASC, id ASC
         """
-        return self.db.fetch_all(sql, (group_id, last_created_at))
+        return self.db.fetch_all(sql, (group_id, last_message_id))
     
     def save(self, group_id: str, role: MessageRole, content: str,
              sender_name: str, mode: str,
              sender_id: str = None,
              user_id: str = "default-user",
-             message_type: MessageType = MessageType.NORMAL) -> str:
+             message_type: MessageType = MessageType.NORMAL) -> dict:
         """
         保存消息
         
+        只回读数据库生成的 created_at（时间以数据库时钟为准，与批量写入及
+        其他消息的排序保持一致），其余字段在进程内直接拼出，不回传消息正文。
+        
         Returns:
-            新消息的 ID
+            新消息的完整行
         """
         msg_id = str(uuid4())
-        self.db.execute("""
+        returned = self.db.execute_returning("""
             INSERT INTO messages (id, group_id, role, content, sender_id, user_id, sender_name, mode, message_type)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING created_at
         """, (msg_id, group_id, role, content, sender_id, user_id, sender_name, mode, message_type.value))
-        return msg_id
+        return {
+            'id': msg_id,
+            'group_id': group_id,
+            'role': MessageRole(role).value,
+            'content': content,
+            'sender_id': sender_id,
+            'user_id': user_id,
+            'sender_name': sender_name,
+            'mode': DiscussionMode(mode).value if mode else None,
+            'message_type': message_type.value,
+            'created_at': returned['created_at'],
+            'is_compressed': False,
+            'original_content': None,
+            'value_score': None,
+        }
+    
+    def save_many(self, records: List[dict]) -> List[dict]:
+        """
+        批量保存消息（一条多行 INSERT）
+        
+        records 每项包含 group_id/role/content/sender_name/mode，
+        可选 sender_id/user_id/message_type。同一语句内 CURRENT_TIMESTAMP 相同，
+        因此按行序递增 1 微秒写入 created_at，保证读取时顺序与传入顺序一致。
+        
+        Returns:
+            与 records 顺序一致的完整行
+        """
+        if not records:
+            return []
+        rows = []
+        for seq, rec in enumerate(records):
+            message_type = rec.get('message_type') or MessageType.NORMAL
+            rows.append((
+                str(uuid4()), rec['group_id'], rec['role'], rec['content'],
+                rec.get('sender_id'), rec.get('user_id', 'default-user'),
+                rec['sender_name'], rec['mode'], message_type.value, seq,
+            ))
+        saved = self.db.execute_values(
+            f"""
+            INSERT INTO messages (id, group_id, role, content, sender_id, user_id, sender_name, mode, message_type, created_at)
+            VALUES %s
+            RETURNING {MESSAGE_COLUMNS}
+            """,
+            rows,
+            template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, clock_timestamp()::timestamp + %s * INTERVAL '1 microsecond')",
+            fetch=True,
+        )
+        by_id = {row['id']: row for row in saved}
+        return [by_id[row[0]] for row in rows]
 
     def get_messages_since_cursor(
         self,
@@ -123,16 +216,16 @@ class MessageDAO(BaseDAO):
     ) -> List[dict]:
         """按(created_at, id)游标增量获取消息"""
         if not last_created_at:
-            sql = """
-                SELECT * FROM messages
+            sql = f"""
+                SELECT {MESSAGE_COLUMNS} FROM messages
                 WHERE group_id = ?
                 ORDER BY created_at ASC, id ASC
                 LIMIT ?
             """
             return self.db.fetch_all(sql, (group_id, limit))
 
-        sql = """
-            SELECT * FROM messages
+        sql = f"""
+            SELECT {MESSAGE_COLUMNS} FROM messages
             WHERE group_id = ?
               AND (
                     created_at > ?
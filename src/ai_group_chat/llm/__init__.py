@@ -1,3 +1,3 @@
-from .client import LLMClient, llm_client
+from .client import LLMClient, llm_client, get_openai_client, is_retryable_error
 
-__all__ = ["LLMClient", "llm_client"]
+__all__ = ["LLMClient", "llm_client", "get_openai_client", "is_retryable_error"]
@@ -1,13 +1,54 @@
 """LLM 客户端封装 - 使用 OpenAI SDK 调用 aihubmix"""
 
-from typing import Optional
-from openai import AsyncOpenAI
+import asyncio
+import weakref
+from typing import AsyncIterator, Optional
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
 import logging
 
 from ..config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# 共享 AsyncOpenAI 客户端：按 (base_url, api_key) 复用连接池。
+# httpx 连接池绑定事件循环，因此按事件循环分别缓存（主循环与后台循环各一份）
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, str], AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+_unbound_clients: dict[tuple[str, str], AsyncOpenAI] = {}
+
+
+def get_openai_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """获取当前事件循环下共享的 AsyncOpenAI 客户端"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    cache = _unbound_clients if loop is None else _loop_clients.setdefault(loop, {})
+    key = (base_url, api_key)
+    client = cache.get(key)
+    if client is None:
+        client = cache[key] = AsyncOpenAI(base_url=base_url, api_key=api_key)
+    return client
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    判断 LLM 调用异常是否值得重试
+
+    连接失败/超时、限流、服务端 5xx 属于瞬时故障；
+    参数错误、鉴权失败、解析错误等确定性失败重试也无济于事。
+    """
+    return isinstance(
+        exc,
+        (APIConnectionError, RateLimitError, InternalServerError, TimeoutError, ConnectionError),
+    )
+
 
 class LLMClient:
     """
@@ -18,31 +59,24 @@ class LLMClient:
     
     def __init__(self):
         self.settings = get_settings()
-        self.client = AsyncOpenAI(
-            base_url=self.settings.ai_api_base,
-            api_key=self.settings.ai_api_key,
-        )
     
-    async def chat(
+    @property
+    def client(self) -> AsyncOpenAI:
+        return get_openai_client(self.settings.ai_api_base, self.settings.ai_api_key)
+    
+    async def chat_stream(
         self,
         model: str,
         messages: list[dict],
         system_prompt: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: int = 2048,
-    ) -> str:
+    ) -> AsyncIterator[str]:
         """
-        发送聊天请求
+        流式发送聊天请求，逐段产出回复内容
         
-        Args:
-            model: 模型ID，如 "mimo-v2-flash-free"
-            messages: 消息列表 [{"role": "user", "content": "..."}]
-            system_prompt: 系统提示词
-            temperature: 温度参数
-            max_tokens: 最大token数
-            
-        Returns:
-            模型回复内容
+        参数同 chat。reasoning_content（某些模型的思考过程）会先缓存，
+        仅当整个回复没有正文时才在末尾产出，与非流式行为一致。
         """
         # 构建完整消息列表
         full_messages = []
@@ -50,30 +84,77 @@ class LLMClient:
             full_messages.append({"role": "system", "content": system_prompt})
         full_messages.extend(messages)
         
-        logger.info(f"Calling model: {model}")
+        logger.info(f"Calling model (stream): {model}")
         
         try:
-            response = await self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model=model,
                 messages=full_messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
+                stream=True,
             )
-            
-            # 提取回复内容
-            message = response.choices[0].message
-            content = message.content or ""
-            
-            # 处理可能的 reasoning_content（某些模型的思考过程）
-            reasoning = getattr(message, "reasoning_content", None)
-            if not content and reasoning:
-                content = reasoning
-            
-            return content or "[模型未返回内容]"
-            
         except Exception as e:
             logger.error(f"API Error: {e}")
             raise
+        
+        has_content = False
+        reasoning_parts: list[str] = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta is None:
+                    continue
+                if delta.content:
+                    has_content = True
+                    yield delta.content
+                elif not has_content:
+                    reasoning = getattr(delta, "reasoning_content", None)
+                    if reasoning:
+                        reasoning_parts.append(reasoning)
+        except Exception as e:
+            logger.error(f"API Error: {e}")
+            raise
+        finally:
+            await stream.close()
+        
+        if not has_content and reasoning_parts:
+            yield "".join(reasoning_parts)
+    
+    async def chat(
+        self,
+        model: str,
+        messages: list[dict],
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+    ) -> str:
+        """
+        发送聊天请求（基于 chat_stream 拼接完整回复）
+        
+        Args:
+            model: 模型ID，如 "mimo-v2-flash-free"
+            messages: 消息列表 [{"role": "user", "content": "..."}]
+            system_prompt: 系统提示词
+            temperature: 温度参数
+            max_tokens: 最大token数
+            
+        Returns:
+            模型回复内容
+        """
+        parts = [
+            part
+            async for part in self.chat_stream(
+                model=model,
+                messages=messages,
+                system_prompt=system_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        ]
+        return "".join(parts) or "[模型未返回内容]"
 
 
 # 全局客户端实例
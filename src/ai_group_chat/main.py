@@ -5,12 +5,22 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import get_settings
 from .api import router
+from .dao import db, long_term_memory_dao
+from .services import chat_service
+
+
+async def _flush_memory_touches_periodically() -> None:
+    """定期落库记忆命中记录：低流量时缓冲不会因等不到下一次命中而长期滞留"""
+    while True:
+        await asyncio.sleep(long_term_memory_dao.TOUCH_FLUSH_INTERVAL)
+        await asyncio.to_thread(long_term_memory_dao.flush_touches)
 
 
 @asynccontextmanager
@@ -21,10 +31,27 @@ async def lifespan(app: FastAPI):
     settings = get_settings()
     print(f"📝 Debug模式: {settings.debug}")
     print(f"🔗 数据库: {settings.database_url}")
+    # 导入期不连库，这里统一完成建表/迁移与预设数据加载
+    await asyncio.to_thread(db.initialize)
+    await asyncio.to_thread(chat_service.load_presets)
+    # 预热 pgvector 探测；数据库未就绪时不缓存结果，首次使用时再探测
+    if long_term_memory_dao.vector_available:
+        print("✅ 长期记忆: pgvector 可用")
+    else:
+        print("⚠️ 长期记忆: pgvector 不可用，使用规则检索")
+    
+    touch_flusher = asyncio.create_task(_flush_memory_touches_periodically())
     
     yield
     
-    # 关闭时
+    # 关闭时：停止定期 flush，再落库尚未 flush 的记忆命中记录
+    touch_flusher.cancel()
+    try:
+        await touch_flusher
+    except asyncio.CancelledError:
+        pass
+    await asyncio.to_thread(long_term_memory_dao.flush_touches)
+    await asyncio.to_thread(db.close)
     print("👋 AI群聊后端关闭")
 
 
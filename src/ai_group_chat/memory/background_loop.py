@@ -0,0 +1,53 @@
+"""
+后台事件循环
+
+同步入口（如 classify_batch）统一把协程提交到一个常驻的后台事件循环执行，
+避免每次调用都新建线程池和事件循环，也让异步 HTTP 连接池得以跨调用复用。
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """获取（首次调用时启动）常驻后台事件循环"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever,
+                    name="memory-background-loop",
+                    daemon=True,
+                ).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+    """
+    在后台事件循环中执行协程并同步等待结果
+
+    超时会取消协程并抛出 TimeoutError；不能在后台事件循环自身的线程内调用。
+    """
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("不能在后台事件循环内同步等待协程")
+
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
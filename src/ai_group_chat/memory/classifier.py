@@ -5,14 +5,41 @@
 """
 
 import asyncio
+import hashlib
 import json
 import re
+import weakref
+from collections import Counter, OrderedDict
 from typing import List, Optional
 from loguru import logger
 
 from ..models import Message, MessageRole, MessageType
 from ..llm.client import llm_client
 from ..prompts import CLASSIFY_SYSTEM_PROMPT, build_classify_user_prompt
+from .background_loop import run_sync
+
+# 可选依赖：安装 orjson 时使用 C 实现解析 JSON，否则回退标准库
+try:
+    import orjson
+except (ImportError, ModuleNotFoundError):
+    orjson = None
+
+# LLM 返回的类型字符串 -> MessageType（未知类型按 NORMAL 处理）
+_TYPE_MAP: dict[str, MessageType] = {
+    "user": MessageType.USER,
+    "status": MessageType.STATUS,
+    "reasoning": MessageType.REASONING,
+    "failure": MessageType.FAILURE,
+}
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _parse_item(item) -> Optional[tuple]:
+    """解析单个 {index, type} 分类项，格式不符时返回 None"""
+    if isinstance(item, dict) and "index" in item and isinstance(item.get("type"), str):
+        return item["index"], _TYPE_MAP.get(item["type"].lower(), MessageType.NORMAL)
+    return None
 
 
 class MessageClassifier:
@@ -25,6 +52,12 @@ class MessageClassifier:
     MAX_RETRIES = 3
     RETRY_DELAY = 1
     BATCH_SIZE = 20  # 每批处理的消息数量
+    MAX_CONCURRENT_LLM_CALLS = 8  # 同一事件循环内并发分类请求上限（避免触发限流）
+    
+    # 从 LLM 回复中提取 JSON 数组（有时 LLM 会在 JSON 前后加其他文字）
+    _JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+    
+    EXACT_CACHE_SIZE = 1024  # 完全相同批次的结果缓存容量
     
     # 规则匹配的关键词（用于降级）
     STATUS_KEYWORDS = [
@@ -48,16 +81,25 @@ class MessageClassifier:
         self.model = model
         self.client = llm_client
         
-        # 编译正则表达式（用于降级）
-        self._status_pattern = re.compile(
-            '|'.join(self.STATUS_KEYWORDS), re.IGNORECASE
-        )
-        self._reasoning_pattern = re.compile(
-            '|'.join(self.REASONING_KEYWORDS), re.IGNORECASE
-        )
-        self._failure_pattern = re.compile(
-            '|'.join(self.FAILURE_KEYWORDS), re.IGNORECASE
+        # 编译正则表达式（用于降级）：三类关键词合并为一个带命名分组的模式，单次扫描完成计数
+        self._keyword_pattern = re.compile(
+            "|".join(
+                f"(?P<{category}>{'|'.join(map(re.escape, keywords))})"
+                for category, keywords in (
+                    ("failure", self.FAILURE_KEYWORDS),
+                    ("status", self.STATUS_KEYWORDS),
+                    ("reasoning", self.REASONING_KEYWORDS),
+                )
+            ),
+            re.IGNORECASE,
         )
+        
+        # 精确缓存：批次文本摘要 -> 分类结果，按 LRU 淘汰
+        self._exact_cache: OrderedDict[str, tuple[MessageType, ...]] = OrderedDict()
+        # 进行中的分类请求：批次文本摘要 -> 共享 Future
+        self._inflight: dict[str, asyncio.Future] = {}
+        # 并发限流信号量按事件循环区分（同步入口跑在独立的后台循环上）
+        self._llm_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
     
     async def classify_batch_async(self, messages: List[Message]) -> List[MessageType]:
         """
@@ -72,6 +114,15 @@ class MessageClassifier:
         if not messages:
             return []
         
+        # 超过 BATCH_SIZE 时拆分为子批次并发分类，避免单次回复超出输出 token 预算
+        if len(messages) > self.BATCH_SIZE:
+            chunks = [
+                messages[i:i + self.BATCH_SIZE]
+                for i in range(0, len(messages), self.BATCH_SIZE)
+            ]
+            results = await asyncio.gather(*(self.classify_batch_async(chunk) for chunk in chunks))
+            return [msg_type for chunk_types in results for msg_type in chunk_types]
+        
         # 构建消息描述
         msg_descriptions = []
         for i, msg in enumerate(messages):
@@ -79,25 +130,56 @@ class MessageClassifier:
             msg_descriptions.append(f"[{i}] [{sender}]: {msg.content}")
         
         messages_text = "\n".join(msg_descriptions)
+        
+        # 精确缓存：完全相同的批次直接复用分类结果
+        exact_key = hashlib.blake2b(messages_text.encode("utf-8"), digest_size=16).hexdigest()
+        cached = self._exact_cache.get(exact_key)
+        if cached is not None and len(cached) == len(messages):
+            self._exact_cache.move_to_end(exact_key)
+            logger.info(f"♻️ 分类精确缓存命中，复用 {len(messages)} 条消息的分类结果")
+            return list(cached)
+        
+        # 单飞：同一事件循环内相同批次的并发调用共享同一次分类请求
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(exact_key)
+        if inflight is not None and inflight.get_loop() is loop:
+            logger.info(f"🔗 复用进行中的分类请求（{len(messages)} 条消息）")
+            return list(await asyncio.shield(inflight))
+        
+        future = loop.create_future()
+        self._inflight[exact_key] = future
+        try:
+            types = await self._classify_uncached(messages, messages_text, exact_key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(tuple(types))
+            return types
+        finally:
+            if self._inflight.get(exact_key) is future:
+                del self._inflight[exact_key]
+    
+    async def _classify_uncached(
+        self, messages: List[Message], messages_text: str, exact_key: str
+    ) -> List[MessageType]:
+        """未命中精确缓存时：LLM 分类（带重试）-> 规则降级"""
         user_prompt = build_classify_user_prompt(messages_text)
         
         # 带重试的 LLM 调用
         last_error = None
         for attempt in range(1, self.MAX_RETRIES + 1):
             try:
-                response = await self.client.chat(
-                    model=self.model,
-                    messages=[{"role": "user", "content": user_prompt}],
-                    system_prompt=CLASSIFY_SYSTEM_PROMPT,
-                    temperature=0.1,  # 低温度保证一致性
-                    max_tokens=1000,
-                )
-                
-                # 解析 JSON 响应
-                types = self._parse_response(response, len(messages))
+                # 流式读取并逐项解析 JSON 响应
+                async with self._llm_semaphore():
+                    types = await self._request_types(user_prompt, len(messages))
                 
                 if types:
                     logger.info(f"✅ LLM 分类成功（第 {attempt} 次尝试），分类了 {len(messages)} 条消息")
+                    self._exact_cache_put(exact_key, types)
                     return types
                 else:
                     raise ValueError("解析分类结果失败")
@@ -113,16 +195,83 @@ class MessageClassifier:
         logger.warning(f"⚠️ LLM 分类彻底失败，降级到规则匹配: {last_error}")
         return [self._classify_by_rules(msg) for msg in messages]
     
+    def _exact_cache_put(self, key: str, types: List[MessageType]) -> None:
+        """写入精确缓存（存不可变 tuple，调用方修改返回列表不会污染缓存）"""
+        self._exact_cache[key] = tuple(types)
+        self._exact_cache.move_to_end(key)
+        while len(self._exact_cache) > self.EXACT_CACHE_SIZE:
+            self._exact_cache.popitem(last=False)
+    
+    def _llm_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环的 LLM 并发信号量"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._llm_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._llm_semaphores[loop] = asyncio.Semaphore(self.MAX_CONCURRENT_LLM_CALLS)
+        return semaphore
+    
+    async def _request_types(self, user_prompt: str, expected_count: int) -> Optional[List[MessageType]]:
+        """
+        流式请求分类结果
+        
+        每收到一段回复就解析其中已完整的 {index, type} 对象，
+        所有消息都拿到类型后立即结束读取，不再等待模型输出剩余的收尾内容。
+        """
+        buffer = ""
+        pos = -1  # 下一个待解析位置；-1 表示尚未遇到 JSON 数组起始的 '['
+        type_map: dict = {}
+        stream = self.client.chat_stream(
+            model=self.model,
+            messages=[{"role": "user", "content": user_prompt}],
+            system_prompt=CLASSIFY_SYSTEM_PROMPT,
+            temperature=0.1,  # 低温度保证一致性
+            max_tokens=1000,
+        )
+        try:
+            async for delta in stream:
+                buffer += delta
+                if pos < 0:
+                    start = buffer.find("[")
+                    if start < 0:
+                        continue
+                    pos = start + 1
+                pos = self._consume_items(buffer, pos, type_map)
+                if all(i in type_map for i in range(expected_count)):
+                    break
+        finally:
+            await stream.aclose()
+        
+        if type_map:
+            return [type_map.get(i, MessageType.NORMAL) for i in range(expected_count)]
+        # 逐项解析未取得结果时，回退到整段解析
+        return self._parse_response(buffer, expected_count)
+    
+    @staticmethod
+    def _consume_items(buffer: str, pos: int, type_map: dict) -> int:
+        """从 pos 起解析 buffer 中已完整的 JSON 对象写入 type_map，返回新的解析位置"""
+        while True:
+            start = buffer.find("{", pos)
+            if start < 0:
+                return pos
+            try:
+                item, end = _JSON_DECODER.raw_decode(buffer, start)
+            except ValueError:
+                # 对象尚未接收完整，等待后续内容
+                return pos
+            pos = end
+            entry = _parse_item(item)
+            if entry is not None:
+                type_map[entry[0]] = entry[1]
+    
     def _parse_response(self, response: str, expected_count: int) -> Optional[List[MessageType]]:
         """解析 LLM 响应的 JSON"""
         try:
-            # 尝试提取 JSON 数组
-            # 有时 LLM 会在 JSON 前后加其他文字
-            json_match = re.search(r'\[.*\]', response, re.DOTALL)
+            json_match = self._JSON_ARRAY_RE.search(response)
             if not json_match:
                 return None
             
-            data = json.loads(json_match.group())
+            raw = json_match.group()
+            data = orjson.loads(raw) if orjson is not None else json.loads(raw)
             
             if not isinstance(data, list):
                 return None
@@ -130,21 +279,9 @@ class MessageClassifier:
             # 构建类型映射
             type_map = {}
             for item in data:
-                if isinstance(item, dict) and "index" in item and "type" in item:
-                    idx = item["index"]
-                    type_str = item["type"].lower()
-                    
-                    # 映射到 MessageType
-                    if type_str == "user":
-                        type_map[idx] = MessageType.USER
-                    elif type_str == "status":
-                        type_map[idx] = MessageType.STATUS
-                    elif type_str == "reasoning":
-                        type_map[idx] = MessageType.REASONING
-                    elif type_str == "failure":
-                        type_map[idx] = MessageType.FAILURE
-                    else:
-                        type_map[idx] = MessageType.NORMAL
+                entry = _parse_item(item)
+                if entry is not None:
+                    type_map[entry[0]] = entry[1]
             
             # 按顺序构建结果列表
             result = []
@@ -153,7 +290,8 @@ class MessageClassifier:
             
             return result
             
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # json / orjson 的解码错误均为 ValueError 子类
             logger.error(f"解析分类响应失败: {e}")
             return None
     
@@ -162,17 +300,13 @@ class MessageClassifier:
         if message.role == MessageRole.USER:
             return MessageType.USER
         
-        content = message.content
-        
-        failure_matches = len(self._failure_pattern.findall(content))
-        status_matches = len(self._status_pattern.findall(content))
-        reasoning_matches = len(self._reasoning_pattern.findall(content))
+        counts = Counter(m.lastgroup for m in self._keyword_pattern.finditer(message.content))
         
-        if failure_matches >= 2:
+        if counts["failure"] >= 2:
             return MessageType.FAILURE
-        if status_matches >= 2:
+        if counts["status"] >= 2:
             return MessageType.STATUS
-        if reasoning_matches >= 3:
+        if counts["reasoning"] >= 3:
             return MessageType.REASONING
         
         return MessageType.NORMAL
@@ -193,14 +327,8 @@ class MessageClassifier:
             return []
         
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(asyncio.run, self.classify_batch_async(messages))
-                    return future.result(timeout=60)
-            else:
-                return loop.run_until_complete(self.classify_batch_async(messages))
+            # 提交到常驻后台事件循环，复用事件循环与 HTTP 连接
+            return run_sync(self.classify_batch_async(messages), timeout=60)
         except Exception as e:
             logger.error(f"批量分类失败，降级到规则匹配: {e}")
             return [self._classify_by_rules(msg) for msg in messages]
@@ -216,16 +344,7 @@ class MessageClassifier:
         
         types = self.classify_batch(messages)
         
-        for msg, msg_type in zip(messages, types):
-            msg.message_type = msg_type
-        
-        # 统计分类结果
-        type_counts = {}
-        for t in types:
-            type_counts[t.value] = type_counts.get(t.value, 0) + 1
-        logger.info(f"📊 分类结果: {type_counts}")
-        
-        return messages
+        return self._apply_types(messages, types)
     
     async def update_message_types_async(self, messages: List[Message]) -> List[Message]:
         """
@@ -238,13 +357,16 @@ class MessageClassifier:
         
         types = await self.classify_batch_async(messages)
         
+        return self._apply_types(messages, types)
+    
+    @staticmethod
+    def _apply_types(messages: List[Message], types: List[MessageType]) -> List[Message]:
+        """把分类结果写回消息并输出统计"""
         for msg, msg_type in zip(messages, types):
             msg.message_type = msg_type
         
         # 统计分类结果
-        type_counts = {}
-        for t in types:
-            type_counts[t.value] = type_counts.get(t.value, 0) + 1
-        logger.info(f"📊 分类结果: {type_counts}")
+        type_counts = Counter(t.value for t in types)
+        logger.info(f"📊 分类结果: {dict(type_counts)}")
         
         return messages
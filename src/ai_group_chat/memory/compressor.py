@@ -7,13 +7,17 @@
 - 低分消息：直接丢弃
 """
 
+import heapq
 import re
+from operator import attrgetter
 from typing import List, Tuple, Optional
 from loguru import logger
 
 from ..models import Message, MessageRole, MessageType
 from .value_scorer import ValueThresholds
 
+SUMMARY_SENDER_NAME = "📋 历史摘要"  # 摘要消息的发送者名称，用于识别已有摘要
+
 
 class ContextCompressor:
     """
@@ -62,15 +66,20 @@ class ContextCompressor:
         medium_value = []
         low_value = []
         
+        # 阈值与 append 绑定为局部变量，循环内只剩两次比较
+        high_threshold = self.high_threshold
+        medium_threshold = self.medium_threshold
+        add_high, add_medium, add_low = high_value.append, medium_value.append, low_value.append
+        
         for msg in messages:
             score = msg.value_score or 0
             
-            if score >= self.high_threshold:
-                high_value.append(msg)
-            elif score >= self.medium_threshold:
-                medium_value.append(msg)
+            if score >= high_threshold:
+                add_high(msg)
+            elif score >= medium_threshold:
+                add_medium(msg)
             else:
-                low_value.append(msg)
+                add_low(msg)
         
         logger.debug(f"📊 消息分流: 高分={len(high_value)}, 中分={len(medium_value)}, 低分={len(low_value)}")
         return high_value, medium_value, low_value
@@ -93,8 +102,9 @@ class ContextCompressor:
         # 使用 LLM 智能摘要
         from .summarizer import summarizer
         
+        prior_summary, new_messages = self._split_prior_summaries(messages)
         try:
-            summary_text = summarizer.summarize_sync(messages)
+            summary_text = summarizer.summarize_sync(new_messages, prior_summary)
         except Exception as e:
             logger.error(f"摘要生成异常: {e}")
             summary_text = None
@@ -111,7 +121,7 @@ class ContextCompressor:
             group_id=first_msg.group_id,
             role=first_msg.role,
             content=summary_text,
-            sender_name="📋 历史摘要",
+            sender_name=SUMMARY_SENDER_NAME,
             mode=first_msg.mode,
             created_at=first_msg.created_at,
             message_type=MessageType.STATUS,
@@ -122,6 +132,32 @@ class ContextCompressor:
         
         return summary_message
 
+    @staticmethod
+    def _split_prior_summaries(messages: List[Message]) -> Tuple[Optional[str], List[Message]]:
+        """
+        拆出此前压缩生成的摘要消息
+
+        返回 (已有摘要文本, 其余新消息)；摘要器据此只发送增量内容并在已有摘要上更新。
+        """
+        prior_parts: List[str] = []
+        new_messages: List[Message] = []
+        for msg in messages:
+            if msg.is_compressed and msg.sender_name == SUMMARY_SENDER_NAME:
+                prior_parts.append(msg.content)
+            else:
+                new_messages.append(msg)
+        return ("\n\n".join(prior_parts) if prior_parts else None), new_messages
+
+    @staticmethod
+    def _merge_by_time(high_value: List[Message], condensed: List[Message]) -> List[Message]:
+        """
+        按时间归并高分消息与摘要/中分消息
+        
+        两路输入都来自按时间有序的分流结果（摘要沿用首条中分消息的时间），
+        线性归并即可，无需整体排序；时间相同时高分消息在前，与稳定排序一致。
+        """
+        return list(heapq.merge(high_value, condensed, key=attrgetter("created_at")))
+
     @staticmethod
     def _normalize_text_for_noise_check(text: str) -> str:
         """归一化短句：去空白/常见标点，仅用于低价值短句判断。"""
@@ -185,29 +221,26 @@ class ContextCompressor:
         # 对较早的消息进行分流
         high_value, medium_value, low_value = self.triage_messages(older_messages)
         
-        # 构建压缩后的消息列表
-        compressed = []
-        
-        # 1. 添加高分消息
-        compressed.extend(high_value)
+        # 1. 高分消息全部保留
         
         # 2. 对中分消息生成摘要（如果失败则保留原消息）
+        condensed: List[Message] = []
         if medium_value:
             summary = self.summarize_messages(medium_value)
             if summary:
-                compressed.append(summary)
+                condensed = [summary]
                 logger.info(f"📝 已将 {len(medium_value)} 条中分消息压缩为摘要")
             else:
                 # 摘要失败，保留原消息不压缩
-                compressed.extend(medium_value)
+                condensed = medium_value
                 logger.info(f"📌 摘要失败，保留原始 {len(medium_value)} 条中分消息")
         
         # 3. 低分消息直接丢弃
         if low_value:
             logger.info(f"🗑️ 已丢弃 {len(low_value)} 条低分消息")
         
-        # 4. 按时间排序（保持对话顺序）
-        compressed.sort(key=lambda m: m.created_at)
+        # 4. 按时间归并（保持对话顺序）
+        compressed = self._merge_by_time(high_value, condensed)
         
         # 5. 添加最近的消息
         compressed.extend(recent_messages)
@@ -230,8 +263,9 @@ class ContextCompressor:
         
         from .summarizer import summarizer
         
+        prior_summary, new_messages = self._split_prior_summaries(messages)
         try:
-            summary_text = await summarizer.summarize(messages)
+            summary_text = await summarizer.summarize(new_messages, prior_summary)
         except Exception as e:
             logger.error(f"摘要生成异常: {e}")
             summary_text = None
@@ -246,7 +280,7 @@ class ContextCompressor:
             group_id=first_msg.group_id,
             role=first_msg.role,
             content=summary_text,
-            sender_name="📋 历史摘要",
+            sender_name=SUMMARY_SENDER_NAME,
             mode=first_msg.mode,
             created_at=first_msg.created_at,
             message_type=MessageType.STATUS,
@@ -273,23 +307,21 @@ class ContextCompressor:
         
         high_value, medium_value, low_value = self.triage_messages(older_messages)
         
-        compressed = []
-        compressed.extend(high_value)
-        
         # 异步生成摘要
+        condensed: List[Message] = []
         if medium_value:
             summary = await self.summarize_messages_async(medium_value)
             if summary:
-                compressed.append(summary)
+                condensed = [summary]
                 logger.info(f"📝 已将 {len(medium_value)} 条中分消息压缩为摘要")
             else:
-                compressed.extend(medium_value)
+                condensed = medium_value
                 logger.info(f"📌 摘要失败，保留原始 {len(medium_value)} 条中分消息")
         
         if low_value:
             logger.info(f"🗑️ 已丢弃 {len(low_value)} 条低分消息")
         
-        compressed.sort(key=lambda m: m.created_at)
+        compressed = self._merge_by_time(high_value, condensed)
         compressed.extend(recent_messages)
         
         logger.info(f"✅ 压缩完成: {len(messages)} → {len(compressed)} 条消息")
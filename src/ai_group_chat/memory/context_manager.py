@@ -4,6 +4,8 @@
 核心入口：检测 Token 阈值、协调调用分类器、评分器、压缩器
 """
 
+import asyncio
+import hashlib
 import tiktoken
 from typing import List, Optional
 from loguru import logger
@@ -28,6 +30,8 @@ class ContextManager:
     DEFAULT_MODEL = "gpt-4"  # 用于 token 计算的模型
     DEFAULT_MAX_TOKENS = 128000  # 默认最大 token 数
     DEFAULT_THRESHOLD_RATIO = 0.8  # 触发压缩的阈值（80%）
+    TOKEN_CACHE_SIZE = 50000  # token 计数缓存条目上限
+    TOKENIZE_THREADS = 8  # 批量编码时 tiktoken 使用的线程数
     
     def __init__(self,
                  model: str = DEFAULT_MODEL,
@@ -53,6 +57,13 @@ class ContextManager:
             # 如果模型不支持，使用 cl100k_base（GPT-4 使用的编码）
             self.encoder = tiktoken.get_encoding("cl100k_base")
         
+        # token 计数缓存：文本 -> token 数（同一条消息在多次检查间只编码一次）
+        self._tok_cache: dict[str, int] = {}
+        
+        # 最近一次压缩的输入指纹与结果：同一批消息重复处理时直接复用
+        self._last_ids_hash: Optional[bytes] = None
+        self._last_result: Optional[List[Message]] = None
+        
         # 初始化子组件
         self.classifier = MessageClassifier()
         self.scorer = ValueScorer()
@@ -74,8 +85,13 @@ class ContextManager:
             logger.debug(f"📐 上下文窗口调整: {old_max} → {max_tokens} tokens")
     
     def count_tokens(self, text: str) -> int:
-        """计算文本的 token 数量"""
-        return len(self.encoder.encode(text))
+        """计算文本的 token 数量（按文本内容缓存）"""
+        cached = self._tok_cache.get(text)
+        if cached is None:
+            if len(self._tok_cache) >= self.TOKEN_CACHE_SIZE:
+                self._tok_cache.clear()
+            cached = self._tok_cache[text] = len(self.encoder.encode_ordinary(text))
+        return cached
     
     def count_messages_tokens(self, messages: List[Message]) -> int:
         """
@@ -83,19 +99,68 @@ class ContextManager:
         
         注意：这是一个估算值，实际 API 调用时还会有额外的格式化开销
         """
+        cache = self._tok_cache
+        texts = [msg.content for msg in messages]
+        texts.extend(msg.sender_name for msg in messages if msg.sender_name)
+        if len(cache) + len(texts) > self.TOKEN_CACHE_SIZE:
+            cache.clear()
+        
+        # 未缓存的文本一次交给 tiktoken 批量编码（Rust 侧多线程，释放 GIL）
+        counts: dict[str, int] = {}
+        pending: list[str] = []
+        for text in set(texts):
+            cached = cache.get(text)
+            if cached is None:
+                pending.append(text)
+            else:
+                counts[text] = cached
+        if pending:
+            encoded = self.encoder.encode_ordinary_batch(pending, num_threads=self.TOKENIZE_THREADS)
+            for text, tokens in zip(pending, encoded):
+                counts[text] = cache[text] = len(tokens)
+        
         total = 0
         for msg in messages:
             # 消息内容
-            total += self.count_tokens(msg.content)
+            total += counts[msg.content]
             # 发送者名称（约 4 tokens 的开销）
             if msg.sender_name:
-                total += self.count_tokens(msg.sender_name) + 4
+                total += counts[msg.sender_name] + 4
         
         # 添加一些额外的格式化开销估算
         total += len(messages) * 4  # 每条消息约 4 tokens 的格式开销
         
         return total
     
+    def _ids_hash(self, messages: List[Message]) -> bytes:
+        """
+        消息序列 + 当前阈值的指纹（阈值变化时不复用旧结果）
+
+        除 id 外还计入内容、发送者、分类与价值评分：同 id 的消息被编辑或重新评分后，
+        压缩结果（保留哪些、摘要什么）也会不同，不能复用。
+        """
+        h = hashlib.blake2b(digest_size=8)
+        h.update(str(self.threshold_tokens).encode())
+        for msg in messages:
+            h.update(b"\0")
+            h.update(msg.id.encode())
+            h.update(b"\1")
+            h.update(msg.content.encode())
+            h.update(f"\1{msg.sender_name or ''}\1{msg.message_type}\1{msg.value_score}".encode())
+        return h.digest()
+    
+    def _cached_result(self, ids_hash: bytes) -> Optional[List[Message]]:
+        """命中上次压缩结果时返回其副本"""
+        if ids_hash == self._last_ids_hash and self._last_result is not None:
+            logger.debug("♻️ 消息未变化，复用上次压缩结果")
+            return list(self._last_result)
+        return None
+    
+    def _remember_result(self, ids_hash: bytes, result: List[Message]) -> None:
+        """记录本次压缩的输入指纹与结果（只缓存真正压缩过的结果）"""
+        self._last_ids_hash = ids_hash
+        self._last_result = list(result)
+    
     def should_compress(self, messages: List[Message]) -> bool:
         """
         判断是否需要触发压缩
@@ -106,6 +171,16 @@ class ContextManager:
         Returns:
             是否需要压缩
         """
+        # 快速路径：每个 token 至少对应 1 个 UTF-8 字节、每个字符至多 4 字节，
+        # 因此 4 × 字符数是 token 数的严格上界；上界都不到阈值时无需精确编码
+        upper_bound = len(messages) * 4
+        for msg in messages:
+            upper_bound += len(msg.content) * 4
+            if msg.sender_name:
+                upper_bound += len(msg.sender_name) * 4 + 4
+        if upper_bound < self.threshold_tokens:
+            return False
+        
         current_tokens = self.count_messages_tokens(messages)
         should = current_tokens >= self.threshold_tokens
         
@@ -138,6 +213,12 @@ class ContextManager:
         if not messages:
             return messages
         
+        # 0. 与上次压缩的输入完全相同：直接复用结果，跳过 token 计算与分类
+        ids_hash = self._ids_hash(messages)
+        cached = self._cached_result(ids_hash)
+        if cached is not None:
+            return cached
+        
         # 1. 检查是否需要压缩
         if not force and not self.should_compress(messages):
             return messages
@@ -164,6 +245,7 @@ class ContextManager:
             f"(节省 {saved_tokens} tokens, {saved_ratio:.1f}%)"
         )
         
+        self._remember_result(ids_hash, compressed_messages)
         return compressed_messages
     
     async def process_async(self, messages: List[Message], 
@@ -187,24 +269,27 @@ class ContextManager:
         if not messages:
             return messages
         
+        # 0. 与上次压缩的输入完全相同：直接复用结果，跳过 token 计算与分类
+        ids_hash = self._ids_hash(messages)
+        cached = self._cached_result(ids_hash)
+        if cached is not None:
+            return cached
+        
         # 1. 检查是否需要压缩
         if not force and not self.should_compress(messages):
             return messages
         
         logger.info(f"🔄 开始异步上下文优化流程，当前消息数: {len(messages)}")
         
-        # 2. 消息分类（异步）
-        await self.classifier.update_message_types_async(messages)
-        
-        # 3. 价值评分（CPU 操作，无需异步）
-        self.scorer.score_messages(messages)
+        # 2-3. 消息分类（异步 LLM）+ 价值评分
+        await self.classify_and_score_async(messages)
         
         # 4. 执行压缩（异步）
         compressed_messages = await self.compressor.compress_async(messages)
         
-        # 统计压缩效果
-        original_tokens = self.count_messages_tokens(messages)
-        compressed_tokens = self.count_messages_tokens(compressed_messages)
+        # 统计压缩效果（tiktoken 编码放到线程中执行，避免阻塞事件循环）
+        original_tokens = await asyncio.to_thread(self.count_messages_tokens, messages)
+        compressed_tokens = await asyncio.to_thread(self.count_messages_tokens, compressed_messages)
         saved_tokens = original_tokens - compressed_tokens
         saved_ratio = saved_tokens / original_tokens * 100 if original_tokens > 0 else 0
         
@@ -213,8 +298,20 @@ class ContextManager:
             f"(节省 {saved_tokens} tokens, {saved_ratio:.1f}%)"
         )
         
+        self._remember_result(ids_hash, compressed_messages)
         return compressed_messages
     
+    async def classify_and_score_async(self, messages: List[Message]) -> List[Message]:
+        """
+        先用 LLM 分类，再在本地评分
+        
+        分类由分类器按批次请求 LLM（超过单批上限时拆成多个子批次并发请求）；
+        价值分由类型权重 × 时间衰减在本地确定性计算，与压缩阈值同一标尺，不再调用 LLM。
+        """
+        await self.classifier.update_message_types_async(messages)
+        self.scorer.score_messages(messages)
+        return messages
+    
     def get_stats(self, messages: List[Message]) -> dict:
         """
         获取当前上下文的统计信息
@@ -7,53 +7,86 @@
 
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Optional
 
 from loguru import logger
 from openai import AsyncOpenAI
 
 from ..config import get_settings
+from ..llm.client import get_openai_client
+
+
+@lru_cache(maxsize=8)
+def _pgvector_template(dimensions: int) -> str:
+    """按维度缓存的 pgvector 文本模板，如 `[%.8f,%.8f,...]`"""
+    return "[" + ",".join(["%.8f"] * dimensions) + "]"
 
 
 class EmbeddingService:
     """Embedding 生成服务"""
 
+    MAX_BATCH_INPUTS = 2048  # embeddings 接口单次请求的 input 条数上限
+
     def __init__(self):
         self.settings = get_settings()
         self.enabled = bool(self.settings.mem_vector_enabled)
         self.model = self.settings.mem_embedding_model
         self.dimensions = int(self.settings.mem_embedding_dimensions)
-        self.client = AsyncOpenAI(
-            base_url=self.settings.ai_api_base,
-            api_key=self.settings.ai_api_key,
-        )
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """与 LLMClient 共享的客户端，多个实例不再各自持有连接池"""
+        return get_openai_client(self.settings.ai_api_base, self.settings.ai_api_key)
 
     async def embed(self, text: str) -> Optional[list[float]]:
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: list[str]) -> list[Optional[list[float]]]:
+        """
+        批量生成 embedding（单次请求携带多条 input）
+
+        返回与 texts 一一对应的结果；空文本或所在批次失败时对应位置为 None。
+        """
+        results: list[Optional[list[float]]] = [None] * len(texts)
         if not self.enabled:
-            return None
-        payload = (text or "").strip()
-        if not payload:
-            return None
-        try:
-            resp = await self.client.embeddings.create(
-                model=self.model,
-                input=[payload],
-            )
-            if not resp.data:
-                return None
-            vec = list(resp.data[0].embedding)
-            if self.dimensions > 0 and len(vec) != self.dimensions:
+            return results
+
+        indexed = [(i, payload) for i, text in enumerate(texts) if (payload := (text or "").strip())]
+        for start in range(0, len(indexed), self.MAX_BATCH_INPUTS):
+            chunk = indexed[start:start + self.MAX_BATCH_INPUTS]
+            try:
+                resp = await self.client.embeddings.create(
+                    model=self.model,
+                    input=[payload for _, payload in chunk],
+                )
+            except Exception as e:
+                logger.warning(f"embedding 生成失败，降级非向量检索: {e}")
+                continue
+
+            for pos, item in enumerate(resp.data or []):
+                # 按返回的 index 对齐输入（兼容未返回 index 的实现）
+                idx = getattr(item, "index", pos)
+                if not 0 <= idx < len(chunk):
+                    continue
+                results[chunk[idx][0]] = list(item.embedding)
+
+            first = next((results[i] for i, _ in chunk if results[i] is not None), None)
+            if first is not None and self.dimensions > 0 and len(first) != self.dimensions:
                 logger.warning(
-                    f"embedding 维度不匹配: got={len(vec)} expected={self.dimensions}, 将按返回值继续"
+                    f"embedding 维度不匹配: got={len(first)} expected={self.dimensions}, 将按返回值继续"
                 )
-            return vec
-        except Exception as e:
-            logger.warning(f"embedding 生成失败，降级非向量检索: {e}")
-            return None
+        return results
 
     @staticmethod
     def to_pgvector_literal(vector: list[float] | None) -> str | None:
-        """将 embedding 转成 pgvector 文本格式"""
+        """
+        将 embedding 转成 pgvector 文本格式
+
+        psycopg2 只有文本协议，绑定 float 数组同样会被渲染成十进制文本（位数更长），
+        因此保持定长 8 位小数的 `[x,...]` 文本，由 SQL 侧 `?::vector` 一次解析。
+        """
         if not vector:
             return None
-        return "[" + ",".join(f"{float(x):.8f}" for x in vector) + "]"
+        # 整个向量一次 % 格式化，逐元素格式化循环留在 C 层
+        return _pgvector_template(len(vector)) % tuple(vector)
@@ -12,10 +12,15 @@ from __future__ import annotations
 
 import asyncio
 import hashlib
+import itertools
 import json
+import operator
+import random
 import re
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
+from functools import lru_cache
 from typing import Any
 from uuid import uuid4
 
@@ -23,10 +28,58 @@ import tiktoken
 from loguru import logger
 
 from ..dao import long_term_memory_dao
+from ..llm import is_retryable_error
 from ..models import GroupChat, Message
+from ..prompts import build_memory_pack, memory_pack_version
 from .memory_extractor import MemoryExtractor
 from .memory_gateway import MemoryGateway
 
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fffA-Za-z0-9]+")
+
+_EMPTY_FEATURES: tuple[frozenset[str], frozenset[str]] = (frozenset(), frozenset())
+
+
+@lru_cache(maxsize=4096)
+def _text_features(text: str) -> tuple[frozenset[str], frozenset[str]]:
+    """文本的词法特征（字符 bigram 集合, 词元集合），同一内容跨检索复用"""
+    text = (text or "").strip().lower()
+    if not text:
+        return _EMPTY_FEATURES
+    grams = frozenset(text[i:i + 2] for i in range(len(text) - 1)) or frozenset((text,))
+    return grams, frozenset(_TOKEN_RE.findall(text))
+
+
+@lru_cache(maxsize=1024)
+def _persona_version(
+    member_id: str,
+    model_id: str,
+    description: str | None,
+    task: str | None,
+    thinking: bool,
+    temperature: float,
+) -> str:
+    """成员人设版本号：人设相关字段不变时直接复用缓存的哈希"""
+    raw = f"{member_id}|{model_id}|{description or ''}|{task or ''}|{thinking}|{temperature}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    """cl100k_base 编码器（进程内只加载一次，不可用时返回 None）"""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _count_tokens_cached(text: str) -> int:
+    """按内容缓存 token 数：记忆内容跨检索不变，重复出现时不再编码"""
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode_ordinary(text))
+    return max(1, len(text) // 2)
+
 
 class LongTermMemoryService:
     """长期记忆业务服务"""
@@ -34,18 +87,22 @@ class LongTermMemoryService:
     ARCHIVE_BATCH_LIMIT = 300
     ARCHIVE_THRESHOLD = 10
     MAX_RETRIES = 3
+    RETRIEVAL_CACHE_SIZE = 32  # 每个 (group, user) 保留的近期检索结果数
+    RETRIEVAL_CACHE_THRESHOLD = 0.95  # 复用检索结果所需的 query 余弦相似度
+    RETRIEVAL_CACHE_TTL = 600  # 检索结果复用有效期（秒）
 
     def __init__(self, repo):
         self.repo = repo
         self.dao = long_term_memory_dao
         self.extractor = MemoryExtractor()
         self.gateway = MemoryGateway()
-        self._last_retrieval: dict[tuple[str, str], dict[str, Any]] = {}
-
-        try:
-            self.encoder = tiktoken.get_encoding("cl100k_base")
-        except Exception:
-            self.encoder = None
+        # 每个群最近一次检索的摘要（只保留最新一条，统计时按 group_id 直接取）
+        self._last_retrieval: dict[str, dict[str, Any]] = {}
+        # 语义检索缓存：(group_id, user_id) -> [(query 向量, 过滤条件, 注入块, 记忆 id, 时间)]
+        self._retrieval_cache: dict[tuple[str, str], deque] = {}
+        # 注入块缓存：(group_id, user_id) -> (记忆集合版本, 注入文本)
+        self._memory_packs: dict[tuple[str, str], tuple[str, str]] = {}
+        self.encoder = _get_encoder()
 
     async def archive_incremental(
         self,
@@ -59,11 +116,12 @@ class LongTermMemoryService:
         if not group.memory_enabled or not group.archive_enabled:
             return
 
-        checkpoint = self.dao.get_checkpoint(group.id, user_id)
+        checkpoint = await asyncio.to_thread(self.dao.get_checkpoint, group.id, user_id)
         last_created_at = checkpoint.get("last_message_created_at") if checkpoint else None
         last_message_id = checkpoint.get("last_message_id") if checkpoint else ""
 
-        messages = self.repo.get_messages_since_cursor(
+        messages = await asyncio.to_thread(
+            self.repo.get_messages_since_cursor,
             group_id=group.id,
             last_created_at=last_created_at,
             last_message_id=last_message_id,
@@ -77,7 +135,8 @@ class LongTermMemoryService:
             return
 
         request_id = str(uuid4())
-        self.dao.add_audit_log(
+        await asyncio.to_thread(
+            self.dao.add_audit_log,
             request_id=request_id,
             group_id=group.id,
             user_id=user_id,
@@ -92,14 +151,19 @@ class LongTermMemoryService:
                 memory_ids = await self.gateway.add_memories(prepared) if prepared else []
 
                 last_msg = raw_messages[-1]
-                self.dao.upsert_checkpoint(
+                await asyncio.to_thread(
+                    self.dao.upsert_checkpoint,
                     group_id=group.id,
                     user_id=user_id,
                     last_message_id=last_msg.id,
                     last_message_created_at=last_msg.created_at,
                 )
 
-                self.dao.add_audit_log(
+                # 有新记忆写入，旧的检索结果不再可复用
+                self._invalidate_retrieval_cache(group.id, user_id, prepared)
+
+                await asyncio.to_thread(
+                    self.dao.add_audit_log,
                     request_id=request_id,
                     group_id=group.id,
                     user_id=user_id,
@@ -109,8 +173,9 @@ class LongTermMemoryService:
                 )
                 return
             except Exception as e:
-                if attempt < self.MAX_RETRIES:
-                    await asyncio.sleep(2 ** attempt)
+                # 仅瞬时故障退避重试（带抖动，避免故障恢复时集中重试）；确定性失败直接进死信
+                if attempt < self.MAX_RETRIES and self._is_retryable(e):
+                    await asyncio.sleep((2 ** attempt) * random.uniform(0.5, 1.5))
                     continue
 
                 payload = {
@@ -120,14 +185,16 @@ class LongTermMemoryService:
                     "checkpoint": checkpoint,
                     "message_count": len(raw_messages),
                 }
-                self.dao.add_dead_letter(
+                await asyncio.to_thread(
+                    self.dao.add_dead_letter,
                     group_id=group.id,
                     user_id=user_id,
                     error=str(e),
                     payload=payload,
                     retry_count=attempt,
                 )
-                self.dao.add_audit_log(
+                await asyncio.to_thread(
+                    self.dao.add_audit_log,
                     request_id=request_id,
                     group_id=group.id,
                     user_id=user_id,
@@ -135,6 +202,11 @@ class LongTermMemoryService:
                     detail=str(e),
                 )
                 logger.error(f"长期记忆归档失败: {e}")
+                return
+
+    def _is_retryable(self, exc: BaseException) -> bool:
+        """归档失败是否属于可重试的瞬时故障（LLM 调用或数据库连接）"""
+        return is_retryable_error(exc) or self.dao.db.is_transient_error(exc)
 
     async def build_injection_context(
         self,
@@ -157,35 +229,67 @@ class LongTermMemoryService:
         request_id = str(uuid4())
         persona_versions = self._build_persona_versions(group)
         candidates: list[dict] = []
-        query_embedding = await self.gateway.build_query_embedding(query)
+        query_vector, query_embedding = await self.gateway.embed_query(query)
 
-        if group.scope_user_global:
-            candidates.extend(
-                self.gateway.search_scope(
+        # 近期语义相同的 query（同一过滤条件）直接复用注入块，跳过检索、打分与裁剪
+        cache_key = (group.id, user_id)
+        filter_key = self._retrieval_filter_key(
+            group,
+            persona_versions,
+            max_context_tokens=max_context_tokens,
+            memory_types=memory_types,
+            scopes=scopes,
+        )
+        cached = self._retrieval_cache_get(cache_key, query_vector, filter_key)
+        if cached is not None:
+            block, cached_ids = cached
+            # 命中缓冲达到阈值时会同步落库，放到线程里避免阻塞事件循环
+            await asyncio.to_thread(self.dao.touch_used, cached_ids)
+            self._record_retrieval(
+                group, user_id, request_id, query, cached_ids,
+                memory_types=memory_types, scopes=scopes, cache_hit=True,
+            )
+            logger.debug(f"♻️ 复用相似 query 的长期记忆检索结果: {len(cached_ids)} 条")
+            return block
+
+        # memory_type 过滤下推到 SQL；scope 过滤直接跳过不需要的作用域查询
+        type_filter = sorted({str(x).strip().lower() for x in (memory_types or ()) if str(x).strip()}) or None
+        scope_filter = {str(x).strip() for x in (scopes or ()) if str(x).strip()}
+
+        def wanted(scope: str) -> bool:
+            return not scope_filter or scope in scope_filter
+
+        # 各作用域（含每个成员的 agent_local）的查询互不依赖，并发发出
+        searches = []
+        if group.scope_user_global and wanted("user_global"):
+            searches.append(
+                self.gateway.asearch_scope(
                     scope="user_global",
                     user_id=user_id,
                     min_confidence=group.memory_min_confidence,
                     query_embedding=query_embedding,
+                    memory_types=type_filter,
                     limit=12,
                 )
             )
 
-        if group.scope_group_local:
-            candidates.extend(
-                self.gateway.search_scope(
+        if group.scope_group_local and wanted("group_local"):
+            searches.append(
+                self.gateway.asearch_scope(
                     scope="group_local",
                     user_id=user_id,
                     group_id=group.id,
                     min_confidence=group.memory_min_confidence,
                     query_embedding=query_embedding,
+                    memory_types=type_filter,
                     limit=12,
                 )
             )
 
-        if group.scope_agent_local:
+        if group.scope_agent_local and wanted("agent_local"):
             for member_id, version in persona_versions.items():
-                candidates.extend(
-                    self.gateway.search_scope(
+                searches.append(
+                    self.gateway.asearch_scope(
                         scope="agent_local",
                         user_id=user_id,
                         group_id=group.id,
@@ -193,15 +297,13 @@ class LongTermMemoryService:
                         persona_version=version,
                         min_confidence=group.memory_min_confidence,
                         query_embedding=query_embedding,
+                        memory_types=type_filter,
                         limit=6,
                     )
                 )
 
-        candidates = self._filter_candidates(
-            candidates,
-            memory_types=memory_types,
-            scopes=scopes,
-        )
+        if searches:
+            candidates = list(itertools.chain.from_iterable(await asyncio.gather(*searches)))
 
         if not candidates:
             self.dao.add_audit_log(
@@ -232,7 +334,31 @@ class LongTermMemoryService:
             return ""
 
         ids = [row["id"] for row in selected]
-        self.dao.touch_used(ids)
+        await asyncio.to_thread(self.dao.touch_used, ids)
+        self._record_retrieval(
+            group, user_id, request_id, query, ids,
+            memory_types=memory_types, scopes=scopes, cache_hit=False,
+        )
+        block = self._format_injection_block(group.id, user_id, selected)
+        self._retrieval_cache_put(cache_key, query_vector, filter_key, block, ids)
+        return block
+
+    def _record_retrieval(
+        self,
+        group: GroupChat,
+        user_id: str,
+        request_id: str,
+        query: str,
+        ids: list[str],
+        *,
+        memory_types: set[str] | None,
+        scopes: set[str] | None,
+        cache_hit: bool,
+    ) -> None:
+        """记录一次成功注入（审计日志 + 群统计中的最近检索），复用缓存结果时同样记录"""
+        detail = f"selected={len(ids)}"
+        if cache_hit:
+            detail += ", cache_hit"
         self.dao.add_audit_log(
             request_id=request_id,
             group_id=group.id,
@@ -240,32 +366,98 @@ class LongTermMemoryService:
             event_type="retrieve_hit",
             scope="mixed",
             memory_ids=ids,
-            detail=f"selected={len(ids)}",
+            detail=detail,
         )
 
-        self._last_retrieval[(group.id, user_id)] = {
+        self._last_retrieval[group.id] = {
             "retrieved_at": datetime.now().isoformat(),
             "query": query[:120],
-            "selected_count": len(selected),
+            "selected_count": len(ids),
             "selected_ids": ids,
+            "cache_hit": cache_hit,
             "budget_ratio": group.memory_injection_ratio,
             "memory_types_filter": sorted(memory_types) if memory_types else None,
             "scopes_filter": sorted(scopes) if scopes else None,
         }
-        return self._format_injection_block(selected)
+
+    @staticmethod
+    def _retrieval_filter_key(
+        group: GroupChat,
+        persona_versions: dict[str, str],
+        *,
+        max_context_tokens: int,
+        memory_types: set[str] | None,
+        scopes: set[str] | None,
+    ) -> tuple:
+        """影响检索结果的全部条件；任一变化都不复用缓存"""
+        return (
+            max_context_tokens,
+            frozenset(memory_types or ()),
+            frozenset(scopes or ()),
+            group.scope_user_global,
+            group.scope_group_local,
+            group.scope_agent_local,
+            group.memory_min_confidence,
+            group.memory_score_threshold,
+            group.memory_injection_ratio,
+            group.memory_top_n,
+            tuple(sorted(persona_versions.items())),
+        )
+
+    def _invalidate_retrieval_cache(self, group_id: str, user_id: str, prepared: list[dict[str, Any]]) -> None:
+        """
+        丢弃受本次归档影响的检索缓存
+
+        user_global 记忆在该用户所在的所有群都会被检索到，需清掉该用户全部群的缓存；
+        其余作用域只影响当前群。
+        """
+        if any(record["scope"] == "user_global" for record in prepared):
+            for key in [k for k in self._retrieval_cache if k[1] == user_id]:
+                del self._retrieval_cache[key]
+        else:
+            self._retrieval_cache.pop((group_id, user_id), None)
+
+    def _retrieval_cache_get(
+        self,
+        key: tuple[str, str],
+        query_vector: list[float] | None,
+        filter_key: tuple,
+    ) -> tuple[str, list[str]] | None:
+        """查找有效期内、过滤条件一致且 query 足够相似的检索结果"""
+        entries = self._retrieval_cache.get(key)
+        if not entries or not query_vector:
+            return None
+        now = time.monotonic()
+        best, best_score = None, self.RETRIEVAL_CACHE_THRESHOLD
+        for vec, cached_filter, block, ids, stored_at in entries:
+            if now - stored_at > self.RETRIEVAL_CACHE_TTL or cached_filter != filter_key:
+                continue
+            if len(vec) != len(query_vector):
+                continue
+            score = sum(map(operator.mul, query_vector, vec))
+            if score >= best_score:
+                best, best_score = (block, ids), score
+        return best
+
+    def _retrieval_cache_put(
+        self,
+        key: tuple[str, str],
+        query_vector: list[float] | None,
+        filter_key: tuple,
+        block: str,
+        ids: list[str],
+    ) -> None:
+        if not query_vector:
+            return
+        entries = self._retrieval_cache.setdefault(key, deque(maxlen=self.RETRIEVAL_CACHE_SIZE))
+        entries.append((query_vector, filter_key, block, list(ids), time.monotonic()))
 
     def get_group_stats(self, group_id: str) -> dict:
         """获取长期记忆运行统计（用于前端展示）"""
         db_stats = self.dao.get_group_stats(group_id)
-        latest = None
-        for (g_id, _), value in self._last_retrieval.items():
-            if g_id != group_id:
-                continue
-            if not latest or value.get("retrieved_at", "") > latest.get("retrieved_at", ""):
-                latest = value
         return {
             **db_stats,
-            "last_retrieval": latest,
+            "last_retrieval": self._last_retrieval.get(group_id),
         }
 
     def _prepare_memories(
@@ -335,15 +527,16 @@ class LongTermMemoryService:
 
     @staticmethod
     def _build_persona_versions(group: GroupChat) -> dict[str, str]:
-        versions: dict[str, str] = {}
-        for m in group.members:
-            raw = f"{m.id}|{m.model_id}|{m.description or ''}|{m.task or ''}|{m.thinking}|{m.temperature}"
-            versions[m.id] = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
-        return versions
+        return {
+            m.id: _persona_version(m.id, m.model_id, m.description, m.task, m.thinking, m.temperature)
+            for m in group.members
+        }
 
     def _score_and_filter(self, rows: list[dict], query: str, min_score: float) -> list[dict]:
         seen = set()
         scored: list[dict] = []
+        q_features = _text_features(query)  # query 特征只计算一次
+        now = datetime.now()  # 同一轮打分共用一个参考时间
         for row in rows:
             memory_id = row.get("id")
             if not memory_id or memory_id in seen:
@@ -352,8 +545,8 @@ class LongTermMemoryService:
 
             confidence = float(row.get("confidence", 0.0) or 0.0)
             content = row.get("content", "")
-            lexical = self._lexical_score(query, content)
-            recency = self._recency_bonus(row.get("updated_at"))
+            lexical = self._feature_score(q_features, _text_features(content))
+            recency = self._recency_bonus(row.get("updated_at"), now)
             decay = float(row.get("decay_score", 1.0) or 1.0)
             vector_score = float(row.get("vector_score", 0.0) or 0.0)
             vector_score = max(0.0, min(1.0, vector_score))
@@ -366,13 +559,33 @@ class LongTermMemoryService:
             if score < min_score:
                 continue
 
-            row = dict(row)
+            # 候选行由 Database.fetch_all 为本次检索新建，直接原地写入得分，无需再复制
             row["vector_score"] = round(vector_score, 4)
             row["retrieval_score"] = round(score, 4)
             scored.append(row)
 
         scored.sort(key=lambda x: x["retrieval_score"], reverse=True)
-        return scored
+        return self._drop_near_duplicates(scored)
+
+    def _drop_near_duplicates(self, rows: list[dict]) -> list[dict]:
+        """
+        去掉内容近似重复的候选（同一结论常以 group_local/agent_local 各存一份）
+
+        rows 已按得分降序，重复内容只保留得分最高的一条，省下的预算留给其他记忆。
+
+        只有归一化后（忽略大小写、标点与空白）词元完全一致才算重复：短句里改一个词
+        （“中文”→“英文”、“15日”→“25日”）字面上很相近，含义却相反，必须都保留。
+        """
+        kept: list[dict] = []
+        seen: set[tuple[str, ...]] = set()
+        for row in rows:
+            # 按顺序保留全部词元：词序不同（“Python 优于 Java”/“Java 优于 Python”）含义也不同
+            tokens = tuple(_TOKEN_RE.findall((row.get("content") or "").lower()))
+            if tokens in seen:
+                continue
+            kept.append(row)
+            seen.add(tokens)
+        return kept
 
     def _apply_budget(self, rows: list[dict], *, max_context_tokens: int, ratio: float, top_n: int) -> list[dict]:
         token_budget = max(128, int(max_context_tokens * ratio))
@@ -380,9 +593,12 @@ class LongTermMemoryService:
         used = 0
 
         for row in rows:
-            if len(selected) >= top_n:
+            # 条数已满或预算耗尽（非空内容至少 1 token）时，后续行都不可能再放入
+            if len(selected) >= top_n or used >= token_budget:
                 break
             content = row.get("content", "")
+            if not content:
+                continue
             t = self._count_tokens(content)
             if used + t > token_budget:
                 continue
@@ -392,49 +608,28 @@ class LongTermMemoryService:
         return selected
 
     @staticmethod
-    def _filter_candidates(
-        rows: list[dict],
-        *,
-        memory_types: set[str] | None = None,
-        scopes: set[str] | None = None,
-    ) -> list[dict]:
-        """按 memory_type/scope 过滤候选。"""
-        if not rows:
-            return []
-
-        type_filter = {str(x).strip().lower() for x in (memory_types or set()) if str(x).strip()}
-        scope_filter = {str(x).strip() for x in (scopes or set()) if str(x).strip()}
-        if not type_filter and not scope_filter:
-            return rows
-
-        filtered: list[dict] = []
-        for row in rows:
-            row_type = str(row.get("memory_type", "")).strip().lower()
-            row_scope = str(row.get("scope", "")).strip()
-            if type_filter and row_type not in type_filter:
-                continue
-            if scope_filter and row_scope not in scope_filter:
-                continue
-            filtered.append(row)
-        return filtered
+    def _lexical_score(query: str, content: str) -> float:
+        return LongTermMemoryService._feature_score(_text_features(query), _text_features(content))
 
     @staticmethod
-    def _lexical_score(query: str, content: str) -> float:
-        query = (query or "").strip().lower()
-        content = (content or "").strip().lower()
-        if not query or not content:
+    def _feature_score(
+        q_features: tuple[frozenset[str], frozenset[str]],
+        c_features: tuple[frozenset[str], frozenset[str]],
+    ) -> float:
+        q_grams, q_tokens = q_features
+        c_grams, c_tokens = c_features
+        if not q_grams or not c_grams:
             return 0.0
 
-        seq_ratio = SequenceMatcher(None, query, content).ratio()
-
-        q_tokens = set(re.findall(r"[\u4e00-\u9fffA-Za-z0-9]+", query))
-        c_tokens = set(re.findall(r"[\u4e00-\u9fffA-Za-z0-9]+", content))
+        # 字符 bigram 的 Dice 系数：2|A∩B| / (|A|+|B|)，与 SequenceMatcher.ratio() 同一量纲，
+        # 但只需线性时间的集合运算
+        seq_ratio = 2 * len(q_grams & c_grams) / (len(q_grams) + len(c_grams))
         overlap = len(q_tokens & c_tokens) / max(1, len(q_tokens))
 
         return min(1.0, 0.6 * seq_ratio + 0.4 * overlap)
 
     @staticmethod
-    def _recency_bonus(updated_at) -> float:
+    def _recency_bonus(updated_at, now: datetime | None = None) -> float:
         if not updated_at:
             return 0.0
         if isinstance(updated_at, str):
@@ -442,7 +637,7 @@ class LongTermMemoryService:
                 updated_at = datetime.fromisoformat(updated_at)
             except Exception:
                 return 0.0
-        age_hours = max(0.0, (datetime.now() - updated_at).total_seconds() / 3600)
+        age_hours = max(0.0, ((now or datetime.now()) - updated_at).total_seconds() / 3600)
         if age_hours <= 24:
             return 1.0
         if age_hours <= 24 * 7:
@@ -454,23 +649,18 @@ class LongTermMemoryService:
     def _count_tokens(self, text: str) -> int:
         if not text:
             return 0
-        if self.encoder:
-            return len(self.encoder.encode(text))
-        return max(1, len(text) // 2)
+        return _count_tokens_cached(text)
 
-    @staticmethod
-    def _format_injection_block(rows: list[dict]) -> str:
-        lines = ["[长期背景]"]
-        for i, row in enumerate(rows, start=1):
-            dt = row.get("updated_at")
-            if isinstance(dt, str):
-                date_text = dt[:10]
-            elif isinstance(dt, datetime):
-                date_text = dt.strftime("%Y-%m-%d")
-            else:
-                date_text = "-"
-            scope = row.get("scope", "unknown")
-            conf = float(row.get("confidence", 0.0) or 0.0)
-            lines.append(f"{i}. [{scope}] [时间:{date_text}] [置信:{conf:.2f}] {row.get('content', '')}")
-        lines.append("注意：如与用户本轮明确输入冲突，以本轮输入为准。")
-        return "\n".join(lines)
+    def _format_injection_block(self, group_id: str, user_id: str, rows: list[dict]) -> str:
+        """
+        生成注入块；记忆集合（id + updated_at）未变时直接复用上次的文本，
+        保证注入内容逐字节稳定，利于模型服务端前缀缓存
+        """
+        key = (group_id, user_id)
+        version = memory_pack_version(rows)
+        cached = self._memory_packs.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        version, text = build_memory_pack(rows)
+        self._memory_packs[key] = (version, text)
+        return text
@@ -6,24 +6,39 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import re
 from typing import Any
 
 from loguru import logger
 
-from ..llm import llm_client
+from ..llm import is_retryable_error, llm_client
 from ..models import Message
 from ..prompts import (
     MEMORY_EXTRACT_SYSTEM_PROMPT,
     build_memory_extract_user_prompt,
 )
 
+# 可选依赖：安装 orjson 时使用 C 实现解析 JSON，否则回退标准库
+try:
+    import orjson
+except (ImportError, ModuleNotFoundError):
+    orjson = None
+
+# 规则降级关键词：各编译成一个交替正则，每条消息单次扫描即可判断是否命中任一关键词
+_USER_PREF_KEYWORDS = ("偏好", "喜欢", "请用", "尽量", "习惯", "以后", "希望你")
+_GROUP_ASSET_KEYWORDS = ("结论", "最终", "建议", "方案", "总结", "达成一致")
+_USER_PREF_RE = re.compile("|".join(map(re.escape, _USER_PREF_KEYWORDS)))
+_GROUP_ASSET_RE = re.compile("|".join(map(re.escape, _GROUP_ASSET_KEYWORDS)))
+
 
 class MemoryExtractor:
     """长期记忆抽取器"""
 
     MAX_RETRIES = 2
+    ATTEMPT_TIMEOUT = 30.0  # 单次抽取请求超时（秒）
+    MAX_CONVERSATION_CHARS = 16000  # 送入抽取的对话文本字符上限
 
     def __init__(self, model: str = "gpt-4o-mini"):
         self.model = model
@@ -44,44 +59,87 @@ class MemoryExtractor:
     async def _extract_by_llm(self, conversation_text: str) -> list[dict[str, Any]]:
         user_prompt = build_memory_extract_user_prompt(conversation_text)
         last_err = None
+        hedge = False
         for _ in range(self.MAX_RETRIES):
+            # 上一轮超时/瞬时故障时对冲发出两个请求，取先拿到有效结果的一个，其余取消；否则单发
+            fan_out = 2 if hedge else 1
+            tasks = [asyncio.create_task(self._request_once(user_prompt)) for _ in range(fan_out)]
+            hedge = retry = False
             try:
-                content = await llm_client.chat(
-                    model=self.model,
-                    messages=[{"role": "user", "content": user_prompt}],
-                    system_prompt=MEMORY_EXTRACT_SYSTEM_PROMPT,
-                    temperature=0.1,
-                    max_tokens=1200,
-                )
-                data = self._parse_json_array(content)
-                if data:
-                    return data
-            except Exception as e:
-                last_err = e
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        err = task.exception()
+                        if err is not None:
+                            last_err = err
+                            if is_retryable_error(err):
+                                hedge = retry = True
+                            continue
+                        data = task.result()
+                        if data is None:
+                            # 回复不是合法 JSON 数组：下一轮单发重试
+                            retry = True
+                            continue
+                        # 合法数组直接返回；空数组表示对话里没有值得记住的内容，无需重试
+                        return data
+            finally:
+                for task in tasks:
+                    task.cancel()
+            if not retry:
+                # 鉴权失败、模型不存在等确定性错误，重试也无济于事
+                break
         if last_err:
-            logger.warning(f"长期记忆 LLM 抽取异常: {last_err}")
+            logger.warning(f"长期记忆 LLM 抽取异常: {last_err!r}")
         return []
 
+    async def _request_once(self, user_prompt: str) -> list[dict[str, Any]] | None:
+        """单次抽取请求（带超时），返回解析出的候选列表；回复无法解析时返回 None"""
+        content = await asyncio.wait_for(
+            llm_client.chat(
+                model=self.model,
+                messages=[{"role": "user", "content": user_prompt}],
+                system_prompt=MEMORY_EXTRACT_SYSTEM_PROMPT,
+                temperature=0.1,
+                max_tokens=1200,
+            ),
+            timeout=self.ATTEMPT_TIMEOUT,
+        )
+        return self._parse_json_array(content)
+
     @staticmethod
-    def _parse_json_array(raw: str) -> list[dict[str, Any]]:
-        raw = raw.strip()
-        match = re.search(r"\[.*\]", raw, re.DOTALL)
-        if not match:
-            return []
+    def _parse_json_array(raw: str) -> list[dict[str, Any]] | None:
+        # 取首个 '[' 到最后一个 ']'（等价于原先的贪婪正则，但无需正则扫描）
+        start = raw.find("[")
+        end = raw.rfind("]")
+        if start < 0 or end <= start:
+            return None
+        payload = raw[start:end + 1]
         try:
-            arr = json.loads(match.group(0))
-            if isinstance(arr, list):
-                return [x for x in arr if isinstance(x, dict)]
+            arr = orjson.loads(payload) if orjson is not None else json.loads(payload)
         except Exception:
-            return []
-        return []
-
-    @staticmethod
-    def _build_conversation_text(messages: list[Message]) -> str:
+            return None
+        if isinstance(arr, list):
+            return [x for x in arr if isinstance(x, dict)]
+        return None
+
+    @classmethod
+    def _build_conversation_text(cls, messages: list[Message]) -> str:
+        """从最新消息往前拼接对话文本，超过字符预算即停止（保留最近的对话）"""
+        budget = cls.MAX_CONVERSATION_CHARS
         lines: list[str] = []
-        for msg in messages:
+        used = 0
+        for msg in reversed(messages):
             sender = msg.sender_name or ("用户" if msg.role == "user" else "AI")
-            lines.append(f"[{sender}] {msg.content}")
+            line = f"[{sender}] {msg.content}"
+            used += len(line) + 1
+            if used > budget:
+                if not lines:
+                    # 单条最新消息就超出预算时，保留其开头部分
+                    lines.append(line[:budget])
+                break
+            lines.append(line)
+        lines.reverse()
         return "\n".join(lines)
 
     @staticmethod
@@ -118,16 +176,13 @@ class MemoryExtractor:
         - 用户偏好句 -> user_global
         - 总结/结论句 -> group_local
         """
-        user_pref_keywords = ("偏好", "喜欢", "请用", "尽量", "习惯", "以后", "希望你")
-        group_asset_keywords = ("结论", "最终", "建议", "方案", "总结", "达成一致")
-
         results: list[dict[str, Any]] = []
         for msg in messages[-60:]:
             content = (msg.content or "").strip()
             if not content:
                 continue
 
-            if msg.role == "user" and any(k in content for k in user_pref_keywords):
+            if msg.role == "user" and _USER_PREF_RE.search(content):
                 results.append(
                     {
                         "scope": "user_global",
@@ -139,7 +194,7 @@ class MemoryExtractor:
                 )
                 continue
 
-            if msg.role == "assistant" and any(k in content for k in group_asset_keywords):
+            if msg.role == "assistant" and _GROUP_ASSET_RE.search(content):
                 results.append(
                     {
                         "scope": "group_local",
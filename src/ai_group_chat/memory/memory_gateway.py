@@ -11,6 +11,8 @@ from __future__ import annotations
 import asyncio
 import hashlib
 import inspect
+import math
+from collections import OrderedDict
 from typing import Any
 
 from loguru import logger
@@ -27,16 +29,27 @@ def _normalize_text(text: str) -> str:
 class MemoryGateway:
     """长期记忆统一网关"""
 
+    QUERY_EMBEDDING_CACHE_SIZE = 1024  # query embedding LRU 条目上限
+    FINGERPRINT_EMBEDDING_CACHE_SIZE = 512  # 记忆内容 embedding LRU 条目上限（库内向量之上的 L1）
+
     def __init__(self):
         self.dao = long_term_memory_dao
         self.settings = get_settings()
         self.mem0_client = self._init_mem0_client()
         self.embedding = EmbeddingService()
-        self.vector_enabled = bool(self.embedding.enabled and self.dao.vector_available)
-        if self.vector_enabled:
-            logger.info("✅ MemoryGateway: 启用向量写入/检索")
-        else:
-            logger.warning("⚠️ MemoryGateway: 向量能力未启用，使用规则检索")
+
+        # query embedding 缓存：(embedding 模型, 归一化 query) -> (L2 归一化向量, pgvector literal)
+        self._query_embedding_cache: OrderedDict[tuple[str, str], tuple[list[float], str]] = OrderedDict()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+
+        # 记忆内容 embedding 缓存：(embedding 模型, 内容指纹) -> pgvector literal
+        self._fingerprint_embedding_cache: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    @property
+    def vector_enabled(self) -> bool:
+        """向量写入/检索是否可用（DAO 侧惰性探测，导入期不访问数据库）"""
+        return bool(self.embedding.enabled and self.dao.vector_available)
 
     def _init_mem0_client(self):
         """初始化可选 Mem0 客户端（失败不影响主流程）"""
@@ -60,52 +73,100 @@ class MemoryGateway:
         if not memories:
             return memory_ids
 
-        embedding_literals: list[str | None] = [None] * len(memories)
-        if self.vector_enabled:
-            embedding_literals = await self._embed_memory_contents(memories)
-
-        sync_tasks = []
-        for idx, memory in enumerate(memories):
+        records: list[dict[str, Any]] = []
+        for memory in memories:
             content = (memory.get("content") or "").strip()
             if not content:
                 continue
 
             fp_source = _normalize_text(content)
             fingerprint = hashlib.sha256(fp_source.encode("utf-8")).hexdigest()
-            embedding_literal = embedding_literals[idx]
-
-            record = {
+            records.append({
                 **memory,
                 "fingerprint": fingerprint,
-                "embedding": embedding_literal,
-                "embedding_model": self.embedding.model if embedding_literal else None,
-            }
+                "embedding": None,
+                "embedding_model": None,
+            })
+
+        if records and self.vector_enabled:
+            literals = await self._embed_by_fingerprint(records)
+            for record in records:
+                literal = literals.get(record["fingerprint"])
+                if literal:
+                    record["embedding"] = literal
+                    record["embedding_model"] = self.embedding.model
 
-            memory_id = self.dao.upsert_memory(record)
-            memory_ids.append(memory_id)
+        # 一次多行 UPSERT 写入整批记忆（在线程中执行，不阻塞事件循环）
+        memory_ids = await asyncio.to_thread(self.dao.upsert_memory_batch, records)
 
-            if self.mem0_client:
-                sync_tasks.append(self._sync_to_mem0(record))
+        sync_tasks = []
+        if self.mem0_client:
+            sync_tasks = [self._sync_to_mem0(record) for record in records]
 
         if sync_tasks:
             await asyncio.gather(*sync_tasks, return_exceptions=True)
         return memory_ids
 
-    async def _embed_memory_contents(self, memories: list[dict[str, Any]]) -> list[str | None]:
-        """批量生成 memory embedding（失败自动降级）"""
-        tasks = [
-            self.embedding.embed((m.get("content") or "").strip())
-            for m in memories
-        ]
-        vectors = await asyncio.gather(*tasks, return_exceptions=True)
-        literals: list[str | None] = []
-        for item in vectors:
-            if isinstance(item, Exception):
-                literals.append(None)
-                continue
-            literals.append(self.embedding.to_pgvector_literal(item))
+    async def _embed_by_fingerprint(self, records: list[dict[str, Any]]) -> dict[str, str]:
+        """
+        按内容指纹获取 embedding：进程内 LRU -> 库内已有向量 -> 批量请求
+
+        相同内容（指纹相同）在同一模型下只请求一次 embedding。
+        """
+        model = self.embedding.model
+        l1 = self._fingerprint_embedding_cache
+        literals: dict[str, str] = {}
+        contents: dict[str, str] = {}
+        for record in records:
+            fingerprint = record["fingerprint"]
+            cached = l1.get((model, fingerprint))
+            if cached is not None:
+                l1.move_to_end((model, fingerprint))
+                literals[fingerprint] = cached
+            else:
+                contents.setdefault(fingerprint, record["content"])
+
+        if contents:
+            try:
+                stored = await asyncio.to_thread(self.dao.get_embeddings_by_fingerprint, model, list(contents))
+            except Exception as e:
+                logger.warning(f"读取已有 embedding 失败，改为重新生成: {e}")
+                stored = {}
+            literals.update(stored)
+
+            missing = [fp for fp in contents if fp not in stored]
+            if missing:
+                generated = await self._embed_memory_contents([{"content": contents[fp]} for fp in missing])
+                for fingerprint, literal in zip(missing, generated):
+                    if literal:
+                        literals[fingerprint] = literal
+
+            for fingerprint in contents:
+                literal = literals.get(fingerprint)
+                if literal:
+                    l1[(model, fingerprint)] = literal
+            while len(l1) > self.FINGERPRINT_EMBEDDING_CACHE_SIZE:
+                l1.popitem(last=False)
         return literals
 
+    async def _embed_memory_contents(self, memories: list[dict[str, Any]]) -> list[str | None]:
+        """批量生成 memory embedding（一次请求整批，失败的条目逐条重试一次后降级）"""
+        contents = [(m.get("content") or "").strip() for m in memories]
+        vectors = await self.embedding.embed_many(contents)
+
+        # 只对批量请求中失败的非空条目逐条重试
+        failed = [i for i, (text, vec) in enumerate(zip(contents, vectors)) if text and vec is None]
+        if failed:
+            retried = await asyncio.gather(
+                *(self.embedding.embed(contents[i]) for i in failed),
+                return_exceptions=True,
+            )
+            for i, item in zip(failed, retried):
+                if not isinstance(item, Exception):
+                    vectors[i] = item
+
+        return [self.embedding.to_pgvector_literal(vec) for vec in vectors]
+
     async def _sync_to_mem0(self, record: dict[str, Any]) -> None:
         """
         尽力同步到 Mem0。
@@ -147,6 +208,7 @@ class MemoryGateway:
         persona_version: str | None = None,
         min_confidence: float = 0.0,
         query_embedding: str | None = None,
+        memory_types: list[str] | None = None,
         limit: int = 20,
     ) -> list[dict]:
         """按作用域检索候选（本地主存）"""
@@ -158,12 +220,68 @@ class MemoryGateway:
             persona_version=persona_version,
             min_confidence=min_confidence,
             query_embedding=query_embedding if self.vector_enabled else None,
+            memory_types=memory_types,
+            limit=limit,
+        )
+
+    async def asearch_scope(
+        self,
+        *,
+        scope: str,
+        user_id: str,
+        group_id: str | None = None,
+        member_id: str | None = None,
+        persona_version: str | None = None,
+        min_confidence: float = 0.0,
+        query_embedding: str | None = None,
+        memory_types: list[str] | None = None,
+        limit: int = 20,
+    ) -> list[dict]:
+        """search_scope 的异步版本：在线程中执行数据库查询，便于多个作用域并发检索"""
+        return await asyncio.to_thread(
+            self.search_scope,
+            scope=scope,
+            user_id=user_id,
+            group_id=group_id,
+            member_id=member_id,
+            persona_version=persona_version,
+            min_confidence=min_confidence,
+            query_embedding=query_embedding,
+            memory_types=memory_types,
             limit=limit,
         )
 
     async def build_query_embedding(self, query: str) -> str | None:
         """为检索 query 生成 embedding literal"""
+        return (await self.embed_query(query))[1]
+
+    async def embed_query(self, query: str) -> tuple[list[float] | None, str | None]:
+        """
+        为检索 query 生成 (L2 归一化向量, pgvector literal)，按归一化 query 做 LRU 缓存
+
+        向量供调用方做语义缓存比对，literal 直接用于 SQL 检索。
+        """
         if not self.vector_enabled:
-            return None
+            return None, None
+
+        # 键里带上模型名，切换 embedding 模型后不会误用旧向量
+        key = (self.embedding.model, _normalize_text(query))
+        cache = self._query_embedding_cache
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+            self.query_cache_hits += 1
+            return cached
+
+        self.query_cache_misses += 1
         vec = await self.embedding.embed(query)
-        return self.embedding.to_pgvector_literal(vec)
+        literal = self.embedding.to_pgvector_literal(vec)
+        if literal is None:
+            return None, None
+
+        norm = math.sqrt(sum(x * x for x in vec))
+        unit = [x / norm for x in vec] if norm else None
+        cache[key] = (unit, literal)
+        if len(cache) > self.QUERY_EMBEDDING_CACHE_SIZE:
+            cache.popitem(last=False)
+        return unit, literal
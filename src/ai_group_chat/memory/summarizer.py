@@ -5,12 +5,18 @@
 """
 
 import asyncio
-from typing import List, Optional
+import hashlib
+import random
+import weakref
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
 from loguru import logger
 
+from ..config import get_settings
 from ..models import Message
-from ..llm.client import llm_client
+from ..llm.client import is_retryable_error, llm_client
 from ..prompts import SUMMARIZE_SYSTEM_PROMPT, build_summarize_user_prompt
+from .background_loop import run_sync
 
 
 class Summarizer:
@@ -20,69 +26,209 @@ class Summarizer:
     使用 LLM 对消息进行摘要
     """
     
-    def __init__(self, model: str = "gpt-4o-mini"):
+    def __init__(self,
+                 model: str = "gpt-4o-mini",
+                 max_retries: Optional[int] = None,
+                 retry_base: Optional[float] = None,
+                 retry_cap: Optional[float] = None,
+                 max_concurrency: Optional[int] = None):
         """
         初始化摘要器
         
         Args:
             model: 用于摘要的模型ID
+            max_retries: 最大尝试次数（默认 MAX_RETRIES）
+            retry_base: 退避基数（秒，默认 RETRY_DELAY）
+            retry_cap: 单次退避上限（秒，默认 RETRY_DELAY_CAP）
+            max_concurrency: 摘要调用并发上限（默认取配置 summary_concurrency）
         """
         self.model = model
         self.client = llm_client
+        self.max_retries = max_retries or self.MAX_RETRIES
+        self.retry_base = self.RETRY_DELAY if retry_base is None else retry_base
+        self.retry_cap = self.RETRY_DELAY_CAP if retry_cap is None else retry_cap
+        if max_concurrency is None:
+            max_concurrency = get_settings().summary_concurrency
+        self.max_concurrency = max(1, max_concurrency or self.MAX_CONCURRENT_CALLS)
+        # 各事件循环各自的并发信号量（同步入口运行在后台事件循环上）
+        self._llm_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.skipped_count = 0  # 因内容过短而跳过 LLM 的次数
+        # 摘要结果缓存：blake2b(模型, 系统提示词, 用户提示词) -> 摘要文本
+        self._summary_cache: OrderedDict[str, str] = OrderedDict()
     MAX_RETRIES = 3  # 最大重试次数
-    RETRY_DELAY = 1  # 重试间隔（秒）
+    RETRY_DELAY = 1  # 重试退避基数（秒），第 n 次重试前等待 base × 2^(n-1) + 随机抖动
+    RETRY_DELAY_CAP = 30  # 单次退避上限（秒）
+    MAX_CONCURRENT_CALLS = 8  # 多个群同时压缩时，摘要 LLM 调用的默认并发上限
+    SUMMARY_CACHE_SIZE = 512  # 相同输入的摘要结果 LRU 条目上限
+    MIN_SUMMARIZE_CHARS = 300  # 待摘要文本（含已有摘要）短于该长度时不调用 LLM，原样保留
     
-    async def summarize(self, messages: List[Message]) -> Optional[str]:
+    async def summarize(self, messages: List[Message],
+                        prior_summary: Optional[str] = None) -> Optional[str]:
         """
         对消息列表生成摘要
         
-        包含重试逻辑：失败时最多重试3次
+        包含重试逻辑：限流/超时/5xx 等瞬时错误按指数退避（带抖动）重试，
+        确定性错误不再重试
+        
+        提供 prior_summary 时只发送已有摘要 + 新增消息，由模型增量更新摘要，
+        避免每次重发完整历史。
         
         Args:
-            messages: 需要摘要的消息列表
+            messages: 需要摘要的消息列表（有已有摘要时仅为新增部分）
+            prior_summary: 已有摘要文本（可选）
             
         Returns:
             摘要文本，如果所有重试都失败则返回 None
         """
         if not messages:
-            return None
-        
-        # 构建对话文本
-        conversation_lines = []
-        for msg in messages:
-            sender = msg.sender_name or ("用户" if msg.role == "user" else "AI")
-            conversation_lines.append(f"[{sender}]: {msg.content}")
+            return prior_summary or None
         
-        conversation_text = "\n".join(conversation_lines)
-        user_prompt = build_summarize_user_prompt(conversation_text)
+        conversation_text, user_prompt = self._build_prompt(messages, prior_summary)
+        cache_key = self._cache_key(user_prompt)
+        shortcut = self._shortcut(conversation_text, prior_summary, cache_key)
+        if shortcut is not None:
+            return shortcut
         
-        # 带重试的 LLM 调用
+        # 带重试的 LLM 调用：结果整段缓冲后才返回，流中途断开也可以安全地整体重试
         last_error = None
-        for attempt in range(1, self.MAX_RETRIES + 1):
+        for attempt in range(1, self.max_retries + 1):
             try:
-                summary = await self.client.chat(
-                    model=self.model,
-                    messages=[{"role": "user", "content": user_prompt}],
-                    system_prompt=SUMMARIZE_SYSTEM_PROMPT,
-                    temperature=0.3,
-                    max_tokens=500,
-                )
+                summary = "".join([part async for part in self._stream_once(user_prompt)])
+                if not summary:
+                    logger.warning("⚠️ LLM 摘要返回为空，放弃本次压缩")
+                    return None
                 
                 logger.info(f"✅ LLM 摘要生成成功（第 {attempt} 次尝试），原文 {len(conversation_text)} 字 → 摘要 {len(summary)} 字")
+                self._cache_put(cache_key, summary)
                 return summary
                 
             except Exception as e:
                 last_error = e
-                logger.warning(f"⚠️ LLM 摘要失败（第 {attempt}/{self.MAX_RETRIES} 次）: {e}")
+                logger.warning(f"⚠️ LLM 摘要失败（第 {attempt}/{self.max_retries} 次）: {e}")
                 
-                if attempt < self.MAX_RETRIES:
-                    await asyncio.sleep(self.RETRY_DELAY)
+                if not is_retryable_error(e):
+                    break
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._retry_delay(attempt))
         
-        # 所有重试都失败了
-        logger.error(f"❌ LLM 摘要彻底失败，已重试 {self.MAX_RETRIES} 次: {last_error}")
+        # 所有重试都失败了（或遇到不可重试的错误）
+        logger.error(f"❌ LLM 摘要彻底失败，共尝试 {attempt} 次: {last_error}")
         return None  # 返回 None，让上层决定不压缩
     
-    def summarize_sync(self, messages: List[Message]) -> Optional[str]:
+    async def stream_summarize(self, messages: List[Message],
+                               prior_summary: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        流式生成摘要，逐段产出文本，调用方可以边接收边展示/写入
+        
+        尚未产出任何内容前的瞬时错误按指数退避（带抖动）重试；
+        一旦开始产出，中途出错直接抛给调用方（已产出的内容无法撤回）。
+        只需要完整结果的调用方应使用 summarize：它整段缓冲，中途断开也会整体重试。
+        """
+        if not messages:
+            if prior_summary:
+                yield prior_summary
+            return
+        
+        conversation_text, user_prompt = self._build_prompt(messages, prior_summary)
+        cache_key = self._cache_key(user_prompt)
+        shortcut = self._shortcut(conversation_text, prior_summary, cache_key)
+        if shortcut is not None:
+            yield shortcut
+            return
+        
+        for attempt in range(1, self.max_retries + 1):
+            emitted = False
+            parts: List[str] = []
+            try:
+                async for part in self._stream_once(user_prompt):
+                    emitted = True
+                    parts.append(part)
+                    yield part
+                if parts:
+                    self._cache_put(cache_key, "".join(parts))
+                return
+            except Exception as e:
+                if emitted or not is_retryable_error(e) or attempt >= self.max_retries:
+                    logger.error(f"❌ LLM 流式摘要失败（第 {attempt}/{self.max_retries} 次）: {e}")
+                    raise
+                logger.warning(f"⚠️ LLM 流式摘要失败（第 {attempt}/{self.max_retries} 次）: {e}")
+                await asyncio.sleep(self._retry_delay(attempt))
+    
+    @staticmethod
+    def _build_prompt(messages: List[Message], prior_summary: Optional[str]) -> tuple[str, str]:
+        """构建 (对话文本, 用户提示词)"""
+        conversation_text = "\n".join(
+            f"[{msg.sender_name or ('用户' if msg.role == 'user' else 'AI')}]: {msg.content}"
+            for msg in messages
+        )
+        return conversation_text, build_summarize_user_prompt(conversation_text, prior_summary)
+    
+    def _cache_key(self, user_prompt: str) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (self.model, SUMMARIZE_SYSTEM_PROMPT, user_prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[str]:
+        summary = self._summary_cache.get(key)
+        if summary is not None:
+            self._summary_cache.move_to_end(key)
+        return summary
+    
+    def _cache_put(self, key: str, summary: str) -> None:
+        self._summary_cache[key] = summary
+        self._summary_cache.move_to_end(key)
+        while len(self._summary_cache) > self.SUMMARY_CACHE_SIZE:
+            self._summary_cache.popitem(last=False)
+    
+    def _shortcut(self, conversation_text: str, prior_summary: Optional[str], cache_key: str) -> Optional[str]:
+        """无需调用 LLM 的结果：内容过短时原样拼接，或命中摘要缓存；都不满足时返回 None"""
+        trivial = self._trivial_summary(conversation_text, prior_summary)
+        if trivial is not None:
+            return trivial
+        # 重叠窗口的重复摘要（如下游失败后重试）直接复用结果
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.debug("♻️ 命中摘要缓存，跳过 LLM 调用")
+        return cached
+    
+    def _trivial_summary(self, conversation_text: str, prior_summary: Optional[str]) -> Optional[str]:
+        """内容比摘要本身还短时直接拼接原文返回，省掉一次 LLM 往返；否则返回 None"""
+        if len(conversation_text) + len(prior_summary or "") >= self.MIN_SUMMARIZE_CHARS:
+            return None
+        self.skipped_count += 1
+        logger.debug(f"⏭️ 待摘要内容仅 {len(conversation_text)} 字，跳过 LLM（累计跳过 {self.skipped_count} 次）")
+        if prior_summary:
+            return f"{prior_summary}\n{conversation_text}"
+        return conversation_text
+    
+    async def _stream_once(self, user_prompt: str) -> AsyncIterator[str]:
+        """单次流式调用（整个流期间占用一个并发名额）"""
+        async with self._llm_semaphore():
+            async for part in self.client.chat_stream(
+                model=self.model,
+                messages=[{"role": "user", "content": user_prompt}],
+                system_prompt=SUMMARIZE_SYSTEM_PROMPT,
+                temperature=0.3,
+                max_tokens=500,
+            ):
+                yield part
+    
+    def _retry_delay(self, attempt: int) -> float:
+        """第 attempt 次失败后的退避时长：base × 2^(attempt-1) + 随机抖动，不超过上限"""
+        return min(self.retry_base * 2 ** (attempt - 1) + random.random(), self.retry_cap)
+    
+    def _llm_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环的摘要并发信号量"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._llm_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._llm_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+    
+    def summarize_sync(self, messages: List[Message],
+                       prior_summary: Optional[str] = None) -> Optional[str]:
         """
         同步版本的摘要方法（用于非异步环境）
         
@@ -90,14 +236,8 @@ class Summarizer:
             摘要文本，失败返回 None
         """
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(asyncio.run, self.summarize(messages))
-                    return future.result(timeout=60)  # 增加超时以容纳重试
-            else:
-                return loop.run_until_complete(self.summarize(messages))
+            # 提交到常驻后台事件循环，不再为每次调用新建线程池和事件循环
+            return run_sync(self.summarize(messages, prior_summary), timeout=60)  # 超时需容纳重试
         except Exception as e:
             logger.error(f"同步摘要失败: {e}")
             return None  # 失败返回 None
@@ -17,6 +17,8 @@ class ValueScorer:
     根据消息类型权重和时间衰减计算每条消息的价值分数
     """
     
+    __slots__ = ("weights", "_inv_half_life", "_weight_table")
+    
     # 消息类型权重配置（可调整）
     DEFAULT_WEIGHTS: Dict[MessageType, float] = {
         MessageType.USER: 10.0,      # 用户消息权重最高
@@ -37,6 +39,12 @@ class ValueScorer:
             weights: 自定义权重配置，None 则使用默认权重
         """
         self.weights = weights or self.DEFAULT_WEIGHTS
+        self._inv_half_life = 1.0 / self.DECAY_HALF_LIFE_HOURS
+        # 预先为每种消息类型补齐权重（缺省回落到 NORMAL），评分时一次查表、无回退分支
+        fallback = self.weights[MessageType.NORMAL]
+        self._weight_table: Dict[MessageType, float] = {
+            mt: self.weights.get(mt, fallback) for mt in MessageType
+        }
     
     def calculate_time_decay(self, created_at: datetime, reference_time: datetime = None) -> float:
         """
@@ -53,19 +61,15 @@ class ValueScorer:
         """
         if reference_time is None:
             reference_time = datetime.now()
-        
-        # 计算经过的小时数
-        time_diff = reference_time - created_at
-        hours_elapsed = time_diff.total_seconds() / 3600
-        
+        return self._decay(created_at.timestamp(), reference_time.timestamp())
+    
+    def _decay(self, created_ts: float, reference_ts: float) -> float:
+        """按 epoch 秒计算衰减因子（纯浮点运算，不产生 timedelta）"""
         # 确保不会出现负数（消息来自未来？）
-        if hours_elapsed < 0:
-            hours_elapsed = 0
+        hours_elapsed = max(reference_ts - created_ts, 0.0) / 3600
         
-        # 指数衰减公式
-        decay = math.pow(0.5, hours_elapsed / self.DECAY_HALF_LIFE_HOURS)
-        
-        return decay
+        # 指数衰减公式：0.5 ^ x 等价于 2 ^ (-x)，exp2 比通用 pow 更快
+        return math.exp2(-hours_elapsed * self._inv_half_life)
     
     def calculate_value(self, message: Message, reference_time: datetime = None) -> float:
         """
@@ -80,16 +84,14 @@ class ValueScorer:
         Returns:
             价值分数
         """
-        # 获取消息类型权重
-        weight = self.weights.get(message.message_type, self.weights[MessageType.NORMAL])
-        
-        # 计算时间衰减
-        time_decay = self.calculate_time_decay(message.created_at, reference_time)
-        
-        # 计算最终价值
-        value = weight * time_decay
-        
-        return round(value, 4)
+        if reference_time is None:
+            reference_time = datetime.now()
+        return self._value(message, reference_time.timestamp())
+    
+    def _value(self, message: Message, reference_ts: float) -> float:
+        """Value = Weight × Time_Decay（参考时间为 epoch 秒）"""
+        weight = self._weight_table[message.message_type]
+        return round(weight * self._decay(message.created_at.timestamp(), reference_ts), 4)
     
     def score_messages(self, messages: List[Message], reference_time: datetime = None) -> List[Message]:
         """
@@ -102,8 +104,12 @@ class ValueScorer:
         Returns:
             更新了 value_score 字段的消息列表
         """
+        # 整批共用一个参考时间（转成 epoch 秒一次），循环内只做浮点运算
+        if reference_time is None:
+            reference_time = datetime.now()
+        reference_ts = reference_time.timestamp()
         for msg in messages:
-            msg.value_score = self.calculate_value(msg, reference_time)
+            msg.value_score = self._value(msg, reference_ts)
         return messages
     
     def sort_by_value(self, messages: List[Message], descending: bool = True) -> List[Message]:
@@ -111,7 +117,7 @@ class ValueScorer:
         按价值分数排序消息
         
         Args:
-            messages: 消息列表
+            messages: 消息列表（未评分的消息按 0 分排序，不修改消息本身）
             descending: 是否降序（高价值在前）
             
         Returns:
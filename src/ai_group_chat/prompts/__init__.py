@@ -5,10 +5,13 @@ from .group_chat_prompts import (
     DISCUSSION_SUMMARIZER_SYSTEM_PROMPT,
     build_member_system_prompt,
     build_manager_system_prompt,
+    clear_prompt_caches,
 )
 from .memory_prompts import (
     MEMORY_EXTRACT_SYSTEM_PROMPT,
     build_memory_extract_user_prompt,
+    build_memory_pack,
+    memory_pack_version,
 )
 from .context_prompts import (
     CLASSIFY_SYSTEM_PROMPT,
@@ -22,8 +25,11 @@ __all__ = [
     "DISCUSSION_SUMMARIZER_SYSTEM_PROMPT",
     "build_member_system_prompt",
     "build_manager_system_prompt",
+    "clear_prompt_caches",
     "MEMORY_EXTRACT_SYSTEM_PROMPT",
     "build_memory_extract_user_prompt",
+    "build_memory_pack",
+    "memory_pack_version",
     "CLASSIFY_SYSTEM_PROMPT",
     "SUMMARIZE_SYSTEM_PROMPT",
     "build_classify_user_prompt",
@@ -22,15 +22,16 @@ CLASSIFY_SYSTEM_PROMPT = """你是一个消息分类专家。你的任务是对
 请严格按照JSON格式输出，不要有其他内容。"""
 
 
+# 固定说明在前、消息列表在后：system + 说明构成逐字节不变的前缀，便于服务端前缀缓存复用
 CLASSIFY_USER_PROMPT_TEMPLATE = """请对以下消息进行分类。
 
-消息列表：
-{messages}
-
 请返回JSON数组，每个元素对应一条消息的分类结果：
 [{{"index": 0, "type": "类型"}}, {{"index": 1, "type": "类型"}}, ...]
 
-注意：type 只能是 user/status/reasoning/failure/normal 之一。"""
+注意：type 只能是 user/status/reasoning/failure/normal 之一。
+
+消息列表：
+{messages}"""
 
 
 SUMMARIZE_SYSTEM_PROMPT = """你是一个对话摘要专家。你的任务是将一段对话历史压缩成简洁的结构化摘要。
@@ -55,12 +56,28 @@ SUMMARIZE_USER_PROMPT_TEMPLATE = """请对以下对话历史进行摘要：
 
 请生成简洁的结构化摘要："""
 
+# 增量摘要：已有摘要 + 新增对话，只需发送上次摘要之后的增量内容
+SUMMARIZE_INCREMENTAL_USER_PROMPT_TEMPLATE = """请在已有摘要的基础上结合新增对话更新摘要（保留仍然有效的信息，合并新的进展）。
+
+已有摘要：
+{prior_summary}
+
+新增对话：
+{conversation}
+
+请生成更新后的简洁结构化摘要："""
+
 
 def build_classify_user_prompt(messages_text: str) -> str:
     """构建消息分类用户提示词。"""
     return CLASSIFY_USER_PROMPT_TEMPLATE.format(messages=messages_text)
 
 
-def build_summarize_user_prompt(conversation_text: str) -> str:
-    """构建摘要用户提示词。"""
+def build_summarize_user_prompt(conversation_text: str, prior_summary: str | None = None) -> str:
+    """构建摘要用户提示词；提供已有摘要时生成增量更新提示词。"""
+    if prior_summary:
+        return SUMMARIZE_INCREMENTAL_USER_PROMPT_TEMPLATE.format(
+            prior_summary=prior_summary,
+            conversation=conversation_text,
+        )
     return SUMMARIZE_USER_PROMPT_TEMPLATE.format(conversation=conversation_text)
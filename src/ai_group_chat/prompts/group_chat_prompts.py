@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+from functools import lru_cache
+
 from ..models import DiscussionMode
 
 
@@ -49,7 +51,26 @@ def build_member_system_prompt(
     tool_names: list[str] | None = None,
     manager_name: str | None = None,
 ) -> str:
-    """构建群成员系统提示词。"""
+    """构建群成员系统提示词（相同配置的结果会被缓存）。"""
+    return _build_member_system_prompt(
+        my_name,
+        members_str,
+        persona,
+        mode,
+        tuple(tool_names) if tool_names else (),
+        manager_name,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _build_member_system_prompt(
+    my_name: str,
+    members_str: str,
+    persona: str,
+    mode: DiscussionMode,
+    tool_names: tuple[str, ...],
+    manager_name: str | None,
+) -> str:
     base_prompt = f"""
 你是一个ai智能助手，你的名字是"{my_name}"，你正在一个群聊里和其他ai助手聊天，目的是解决用户的问题
 
@@ -103,6 +124,7 @@ def build_member_system_prompt(
     return base_prompt
 
 
+@lru_cache(maxsize=256)
 def build_manager_system_prompt(
     *,
     my_name: str,
@@ -126,3 +148,9 @@ def build_manager_system_prompt(
 - 不要@任何成员
 - 只做一件事：调用 `{tool_name}`
 """
+
+
+def clear_prompt_caches() -> None:
+    """清空提示词缓存（成员人设/管理员配置变更后调用，释放过期条目）。"""
+    _build_member_system_prompt.cache_clear()
+    build_manager_system_prompt.cache_clear()
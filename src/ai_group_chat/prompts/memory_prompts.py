@@ -2,6 +2,9 @@
 
 from __future__ import annotations
 
+import hashlib
+from datetime import datetime
+
 
 MEMORY_EXTRACT_SYSTEM_PROMPT = """你是长期记忆抽取器。请从对话中提取“稳定、可复用”的信息。
 
@@ -27,3 +30,45 @@ MEMORY_EXTRACT_SYSTEM_PROMPT = """你是长期记忆抽取器。请从对话中
 def build_memory_extract_user_prompt(conversation_text: str) -> str:
     """构建长期记忆抽取的用户提示词。"""
     return f"请从以下对话中提取长期记忆候选：\n\n{conversation_text}"
+
+
+MEMORY_PACK_HEADER = "[长期背景]"
+MEMORY_PACK_FOOTER = "注意：如与用户本轮明确输入冲突，以本轮输入为准。"
+
+
+def memory_pack_version(memories: list[dict]) -> str:
+    """
+    记忆集合的版本号（md5）。
+
+    只取 id 与 updated_at：记忆内容/置信度变化都会刷新 updated_at，
+    无需先拼出全文即可判断注入块是否需要重建。
+    """
+    keys = sorted(f"{m.get('id')}@{m.get('updated_at')}" for m in memories)
+    return hashlib.md5("\n".join(keys).encode("utf-8")).hexdigest()
+
+
+def _format_memory_line(index: int, memory: dict) -> str:
+    dt = memory.get("updated_at")
+    if isinstance(dt, str):
+        date_text = dt[:10]
+    elif isinstance(dt, datetime):
+        date_text = dt.strftime("%Y-%m-%d")
+    else:
+        date_text = "-"
+    scope = memory.get("scope", "unknown")
+    conf = float(memory.get("confidence", 0.0) or 0.0)
+    return f"{index}. [{scope}] [时间:{date_text}] [置信:{conf:.2f}] {memory.get('content', '')}"
+
+
+def build_memory_pack(memories: list[dict]) -> tuple[str, str]:
+    """
+    构建确定性的长期记忆注入块，返回 (版本号, 文本)。
+
+    按记忆 id 排序后拼接：同一组记忆无论检索顺序如何都得到逐字节相同的文本，
+    便于模型服务端的前缀缓存命中。
+    """
+    ordered = sorted(memories, key=lambda m: str(m.get("id", "")))
+    lines = [MEMORY_PACK_HEADER]
+    lines.extend(_format_memory_line(i, m) for i, m in enumerate(ordered, start=1))
+    lines.append(MEMORY_PACK_FOOTER)
+    return memory_pack_version(ordered), "\n".join(lines)
@@ -4,13 +4,17 @@
 组合使用 DAO 层，提供业务级别的数据访问接口
 """
 
-from typing import Optional, List
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional, List
 
 from ..models import (
     GroupChat, AIMember, Message,
     AIMemberCreate, AIMemberUpdate, MessageRole, MessageType
 )
 from ..dao import group_dao, member_dao, message_dao, context_snapshot_dao
+from ..prompts import clear_prompt_caches
 
 
 class ChatRepository:
@@ -21,72 +25,148 @@ class ChatRepository:
     负责将 DAO 返回的原始数据转换为领域对象。
     """
     
+    GROUP_CACHE_SIZE = 256  # 群聊对象缓存条目上限
+    GROUP_CACHE_TTL = 30  # 群聊对象缓存有效期（秒），兜底其他进程的写入
+
     def __init__(self):
         self.group_dao = group_dao
         self.member_dao = member_dao
         self.message_dao = message_dao
         self.context_snapshot_dao = context_snapshot_dao
+        # 群聊对象缓存：group_id -> (GroupChat, 写入时间)；本进程内的写操作会立即失效对应条目
+        self._group_cache: OrderedDict[str, tuple[GroupChat, float]] = OrderedDict()
+        self._group_ids_by_name: dict[str, str] = {}
+        self._group_cache_lock = threading.Lock()
+        # 失效代数：每次写操作失效缓存时递增。读库期间发生过写入的加载结果可能已过期，不放入缓存
+        self._group_cache_generation = 0
+
+    # ============ Group Cache ============
+
+    def _cached_group(self, group_id: str) -> Optional[GroupChat]:
+        with self._group_cache_lock:
+            entry = self._group_cache.get(group_id)
+            if entry is None:
+                return None
+            group, stored_at = entry
+            if time.monotonic() - stored_at > self.GROUP_CACHE_TTL:
+                del self._group_cache[group_id]
+                return None
+            self._group_cache.move_to_end(group_id)
+            return group
+
+    def _cache_group(self, group: GroupChat, generation: int) -> GroupChat:
+        """放入缓存；generation 为读库前取得的失效代数，其间有写入时只返回、不缓存"""
+        with self._group_cache_lock:
+            if generation != self._group_cache_generation:
+                return group
+            self._group_cache[group.id] = (group, time.monotonic())
+            self._group_cache.move_to_end(group.id)
+            self._group_ids_by_name[group.name] = group.id
+            while len(self._group_cache) > self.GROUP_CACHE_SIZE:
+                _, (evicted, _) = self._group_cache.popitem(last=False)
+                if self._group_ids_by_name.get(evicted.name) == evicted.id:
+                    del self._group_ids_by_name[evicted.name]
+        return group
+
+    def _invalidate_group(self, group_id: str) -> None:
+        with self._group_cache_lock:
+            self._group_cache_generation += 1
+            entry = self._group_cache.pop(group_id, None)
+            if entry is not None and self._group_ids_by_name.get(entry[0].name) == group_id:
+                del self._group_ids_by_name[entry[0].name]
 
     # ============ Group Operations ============
 
     def get_group_by_name(self, name: str) -> Optional[GroupChat]:
-        row = self.group_dao.get_by_name(name)
-        return self._build_group(row) if row else None
+        group_id = self._group_ids_by_name.get(name)
+        if group_id is not None:
+            group = self._cached_group(group_id)
+            if group is not None and group.name == name:
+                return group
+        return self._load_group(name=name)
 
     def get_group(self, group_id: str) -> Optional[GroupChat]:
-        row = self.group_dao.get_by_id(group_id)
-        return self._build_group(row) if row else None
+        group = self._cached_group(group_id)
+        if group is not None:
+            return group
+        return self._load_group(group_id=group_id)
+
+    def _load_group(self, *, group_id: str = None, name: str = None) -> Optional[GroupChat]:
+        """单群查询：群聊与成员一次 JOIN 读出，构建后放入缓存"""
+        with self._group_cache_lock:
+            generation = self._group_cache_generation
+        row, member_rows = self.group_dao.get_with_members(group_id=group_id, name=name)
+        if not row:
+            return None
+        members = [self.member_dao._row_to_member(member_row) for member_row in member_rows]
+        return self._cache_group(self.group_dao._row_to_group(row, members), generation)
 
     def list_groups(self) -> List[GroupChat]:
-        rows = self.group_dao.list_all()
-        return [self._build_group(row) for row in rows]
+        return self._build_groups(self.group_dao.list_all())
 
     def create_group(self, name: str, discussion_mode: str = 'free',
                      manager_model: str = "qwen-flash") -> GroupChat:
-        group_id = self.group_dao.create(name, discussion_mode, manager_model)
-        return self.get_group(group_id)
+        row = self.group_dao.create(name, discussion_mode, manager_model)
+        # 新建的群还没有成员，无需再查成员表
+        return self.group_dao._row_to_group(row, [])
 
     def delete_group(self, group_id: str) -> bool:
-        return self.group_dao.delete(group_id)
+        deleted = self.group_dao.delete(group_id)
+        self._invalidate_group(group_id)
+        return deleted
 
     def update_manager_config(self, group_id: str, model_id: str,
                               thinking: Optional[bool] = None,
                               temperature: Optional[float] = None) -> bool:
-        return self.group_dao.update_manager_config(group_id, model_id, thinking, temperature)
-
-    def _build_group(self, row: dict) -> GroupChat:
-        """构建完整的 GroupChat 对象（包含成员）"""
-        members = self._get_members_for_group(row['id'])
-        return self.group_dao._row_to_group(row, members)
-
-    def _get_members_for_group(self, group_id: str) -> List[AIMember]:
-        """获取群聊的所有成员"""
-        rows = self.member_dao.get_by_group(group_id)
-        return [self.member_dao._row_to_member(row) for row in rows]
+        found, changed = self.group_dao.update_manager_config(group_id, model_id, thinking, temperature)
+        if changed:
+            self._invalidate_group(group_id)
+            clear_prompt_caches()
+        return found
+
+    def _build_groups(self, rows: List[dict]) -> List[GroupChat]:
+        """
+        批量构建 GroupChat 对象：所有群的成员一次查出，再按 group_id 分桶，
+        避免每个群一次查询（N+1）
+        """
+        if not rows:
+            return []
+        members_by_group: dict[str, List[AIMember]] = {row['id']: [] for row in rows}
+        for member_row in self.member_dao.get_by_groups(list(members_by_group)):
+            members_by_group[member_row['group_id']].append(self.member_dao._row_to_member(member_row))
+        return [self.group_dao._row_to_group(row, members_by_group[row['id']]) for row in rows]
 
     # ============ Member Operations ============
 
     def add_member(self, group_id: str, data: AIMemberCreate) -> AIMember:
-        member_id = self.member_dao.add(group_id, data)
-        row = self.member_dao.get_by_id(member_id)
+        row = self.member_dao.add(group_id, data)
+        self._invalidate_group(group_id)
         return self.member_dao._row_to_member(row)
 
-    def add_raw_member(self, group_id: str, name: str, model_id: str,
-                       description: str, thinking: bool, temperature: float) -> None:
-        """用于预设数据的底层添加"""
-        self.member_dao.add_raw(group_id, name, model_id, description, thinking, temperature)
+    def add_raw_members(self, group_id: str, members: List[dict]) -> None:
+        """用于预设数据的底层批量添加"""
+        self.member_dao.add_raw_many(group_id, members)
+        self._invalidate_group(group_id)
 
     def update_member(self, group_id: str, member_id: str, data: AIMemberUpdate) -> Optional[AIMember]:
-        if self.member_dao.update(group_id, member_id, data):
-            row = self.member_dao.get_by_id(member_id)
-            return self.member_dao._row_to_member(row) if row else None
-        return None
+        row = self.member_dao.update(group_id, member_id, data)
+        if not row:
+            return None
+        self._invalidate_group(group_id)
+        clear_prompt_caches()
+        return self.member_dao._row_to_member(row)
 
     def remove_member(self, group_id: str, member_id: str) -> bool:
-        return self.member_dao.delete(group_id, member_id)
+        removed = self.member_dao.delete(group_id, member_id)
+        self._invalidate_group(group_id)
+        return removed
 
     def update_member_persona(self, group_id: str, member_id: str, persona: str) -> bool:
-        return self.member_dao.update_persona(group_id, member_id, persona)
+        updated = self.member_dao.update_persona(group_id, member_id, persona)
+        if updated:
+            self._invalidate_group(group_id)
+            clear_prompt_caches()
+        return updated
 
     # ============ Message Operations ============
 
@@ -95,7 +175,7 @@ class ChatRepository:
                      sender_id: str = None,
                      user_id: str = "default-user",
                      message_type: MessageType = MessageType.NORMAL) -> Message:
-        msg_id = self.message_dao.save(
+        row = self.message_dao.save(
             group_id=group_id,
             role=role,
             content=content,
@@ -105,9 +185,13 @@ class ChatRepository:
             user_id=user_id,
             message_type=message_type,
         )
-        row = self.message_dao.get_by_id(msg_id)
         return self.message_dao._row_to_message(row)
 
+    def save_messages(self, records: List[dict]) -> List[Message]:
+        """批量保存消息（字段同 save_message），按传入顺序返回"""
+        rows = self.message_dao.save_many(records)
+        return [self.message_dao._row_to_message(row) for row in rows]
+
     def update_message_compression(self, message_id: str,
                                    is_compressed: bool,
                                    compressed_content: str,
@@ -117,9 +201,21 @@ class ChatRepository:
         )
 
     def get_messages(self, group_id: str, limit: int) -> List[Message]:
+        if limit <= 0:
+            return list(self.iter_messages(group_id))
         rows = self.message_dao.get_by_group(group_id, limit)
         return [self.message_dao._row_to_message(row) for row in rows]
 
+    def dump_messages_json(self, group_id: str, limit: int) -> bytes:
+        """消息历史的 JSON 字节（只读接口快速路径，不构造 Message 对象）"""
+        return self.message_dao.dump_by_group_json(group_id, limit)
+
+    def iter_messages(self, group_id: str) -> Iterator[Message]:
+        """按时间升序逐条产出群聊全部消息（逐批从数据库读取，可提前停止）"""
+        row_to_message = self.message_dao._row_to_message
+        for row in self.message_dao.iter_by_group(group_id):
+            yield row_to_message(row)
+
     def get_messages_after(self, group_id: str, last_message_id: str) -> List[Message]:
         """增量加载消息"""
         rows = self.message_dao.get_messages_after(group_id, last_message_id)
@@ -139,7 +235,11 @@ class ChatRepository:
         self.context_snapshot_dao.save(group_id, last_message_id, context, token_count)
 
     def update_group_compression_threshold(self, group_id: str, threshold: float) -> bool:
-        return self.group_dao.update_compression_threshold(group_id, threshold)
+        updated = self.group_dao.update_compression_threshold(group_id, threshold)
+        self._invalidate_group(group_id)
+        return updated
 
     def update_group_memory_settings(self, group_id: str, settings: dict) -> bool:
-        return self.group_dao.update_memory_settings(group_id, settings)
+        updated = self.group_dao.update_memory_settings(group_id, settings)
+        self._invalidate_group(group_id)
+        return updated
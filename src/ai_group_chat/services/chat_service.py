@@ -72,7 +72,6 @@ class ChatService:
         self._active_discussions: dict[str, ExternalTermination] = {}
         self._discussion_lock = asyncio.Lock()
         self._ensure_models_loaded()
-        self._load_presets()
     
     def _ensure_models_loaded(self):
         """确保模型配置已加载"""
@@ -113,8 +112,8 @@ class ChatService:
         logger.debug(f"📐 群聊 {group.name} 最小上下文窗口: {min_window} tokens")
         return min_window
     
-    def _load_presets(self):
-        """加载预设测试数据"""
+    def load_presets(self):
+        """加载预设测试数据（应用启动时由 lifespan 调用）"""
         if not PRESET_GROUPS:
             return
         
@@ -129,16 +128,8 @@ class ChatService:
                 discussion_mode=DiscussionMode.FREE
             )
             
-            # 添加成员
-            for member_data in preset["members"]:
-                self.repo.add_raw_member(
-                    group_id=group.id,
-                    name=member_data["name"],
-                    model_id=member_data["model_id"],
-                    description=member_data.get("description"),
-                    thinking=member_data.get("thinking", False),
-                    temperature=member_data.get("temperature", 0.7)
-                )
+            # 添加成员（整组一次写入）
+            self.repo.add_raw_members(group.id, preset["members"])
             
             logger.info(f"📦 初始化预设群聊: {preset['name']} ({len(preset['members'])} 个成员)")
 
@@ -167,8 +158,7 @@ class ChatService:
         return self.repo.update_member(group_id, member_id, data)
     
     def set_manager_config(self, group_id: str, model_id: str, thinking: bool = None, temperature: float = None) -> bool:
-        if not self.repo.get_group(group_id):
-            return False
+        # 一条语句完成“判断存在 + 有变化才写入”，无需先加载整个群聊
         return self.repo.update_manager_config(group_id, model_id, thinking, temperature)
 
     async def update_compression_threshold(self, group_id: str, threshold: float) -> bool:
@@ -264,6 +254,39 @@ class ChatService:
             scopes=self.AUTO_INJECTION_SCOPES,
         )
 
+    async def _build_discussion_history(
+        self,
+        group: GroupChat,
+        user_id: str,
+        query: str,
+        history_limit: int | None = 50,
+        exclude_last: bool = False,
+    ) -> list[TextMessage]:
+        """
+        并发准备讨论上下文：历史加载（可能触发 LLM 摘要压缩）与长期记忆检索互不依赖，
+        用 gather 重叠两者的等待时间。history_limit 为 None 时不加载历史（QA 模式）。
+        """
+        if history_limit is None:
+            history_task = asyncio.sleep(0, result=[])
+        else:
+            history_task = self._get_history_as_autogen_messages(group.id, limit=history_limit, exclude_last=exclude_last)
+        history_msgs, memory_block = await asyncio.gather(
+            history_task,
+            self._build_auto_injection_memory_block(group=group, user_id=user_id, query=query),
+            return_exceptions=True,
+        )
+        if isinstance(history_msgs, BaseException):
+            raise history_msgs
+        if isinstance(memory_block, BaseException):
+            # 记忆注入是增强项，失败时不影响讨论本身
+            logger.warning(f"长期记忆注入失败，本轮不注入: {memory_block}")
+            memory_block = ""
+        if memory_block:
+            # 记忆块作为独立消息追加在历史之后（紧挨本轮提问）：系统提示词与历史前缀
+            # 不随记忆变化，模型服务端的前缀缓存可以持续命中
+            history_msgs = history_msgs + [TextMessage(content=memory_block, source="system")]
+        return history_msgs
+
     @staticmethod
     def _copy_model(obj, updates: dict):
         """兼容 Pydantic v1/v2 的模型拷贝"""
@@ -372,21 +395,15 @@ class ChatService:
         for attempt in range(2):
             member_id_map = {m.name: m.id for m in runtime_group.members}
             try:
-                if mode == DiscussionMode.QA:
-                    # QA 模式不需要很长的上下文
-                    history_msgs = []
-                else:
-                    # FREE 模式需要上下文
-                    history_msgs = await self._get_history_as_autogen_messages(group_id, limit=50, exclude_last=True)
-
+                # QA 模式不需要历史上下文，FREE 模式需要；
                 # 条件注入长期记忆（仅注入一次，不会每轮灌入）
-                memory_block = await self._build_auto_injection_memory_block(
-                    group=runtime_group,
-                    user_id=request.user_id,
-                    query=request.content,
+                history_msgs = await self._build_discussion_history(
+                    runtime_group,
+                    request.user_id,
+                    request.content,
+                    history_limit=None if mode == DiscussionMode.QA else 50,
+                    exclude_last=True,
                 )
-                if memory_block:
-                    history_msgs = [TextMessage(content=memory_block, source="system")] + history_msgs
                 toolkits = self._build_toolkits(runtime_group, request.user_id)
 
                 ai_group_chat = AIGroupChat(
@@ -413,33 +430,34 @@ class ChatService:
                         max_rounds=request.max_rounds,
                     )
 
-                # 保存结果
-                result_messages = []
-                for msg_data in messages_data:
-                    message = self.repo.save_message(
-                        group_id=group_id,
-                        role=MessageRole.ASSISTANT,
-                        content=msg_data["content"],
-                        sender_name=msg_data["sender"],
-                        mode=mode,
-                        sender_id=member_id_map.get(msg_data["sender"]),
-                        user_id=request.user_id,
-                    )
-                    result_messages.append(message)
+                # 保存结果（整轮讨论一次批量写入）
+                records = [
+                    {
+                        "group_id": group_id,
+                        "role": MessageRole.ASSISTANT,
+                        "content": msg_data["content"],
+                        "sender_name": msg_data["sender"],
+                        "mode": mode,
+                        "sender_id": member_id_map.get(msg_data["sender"]),
+                        "user_id": request.user_id,
+                    }
+                    for msg_data in messages_data
+                ]
 
                 if ai_group_chat.was_terminated_by_system():
-                    notice = self.repo.save_message(
-                        group_id=group_id,
-                        role=MessageRole.SYSTEM,
-                        content=self._build_system_termination_notice(
+                    records.append({
+                        "group_id": group_id,
+                        "role": MessageRole.SYSTEM,
+                        "content": self._build_system_termination_notice(
                             ai_group_chat.last_system_termination_reason
                         ),
-                        sender_name="系统",
-                        mode=mode,
-                        sender_id=None,
-                        user_id=request.user_id,
-                    )
-                    result_messages.append(notice)
+                        "sender_name": "系统",
+                        "mode": mode,
+                        "sender_id": None,
+                        "user_id": request.user_id,
+                    })
+
+                result_messages = self.repo.save_messages(records)
 
                 self._schedule_memory_archive(group=group, user_id=request.user_id, reason="discussion_sync")
                 return DiscussionResponse(messages=result_messages, summary=None)
@@ -491,14 +509,13 @@ class ChatService:
                     # 获取历史消息作为上下文
                     # 注意: exclude_last=True 是为了避免重复包含刚刚保存的用户消息，
                     # 因为在 AutoGen 中，用户的提问通常作为 initiate_chat 的 message 参数传入
-                    history_msgs = await self._get_history_as_autogen_messages(group_id, limit=50, exclude_last=True)
-                    memory_block = await self._build_auto_injection_memory_block(
-                        group=runtime_group,
-                        user_id=request.user_id,
-                        query=request.content,
+                    history_msgs = await self._build_discussion_history(
+                        runtime_group,
+                        request.user_id,
+                        request.content,
+                        history_limit=50,
+                        exclude_last=True,
                     )
-                    if memory_block:
-                        history_msgs = [TextMessage(content=memory_block, source="system")] + history_msgs
                     toolkits = self._build_toolkits(runtime_group, request.user_id)
 
                     ai_group_chat = AIGroupChat(
@@ -608,14 +625,12 @@ class ChatService:
         for attempt in range(2):
             member_id_map = {m.name: m.id for m in runtime_group.members}
             try:
-                history_msgs = await self._get_history_as_autogen_messages(group_id, limit=100)
-                memory_block = await self._build_auto_injection_memory_block(
-                    group=runtime_group,
-                    user_id=request.user_id,
-                    query=request.instruction or "总结并提炼群聊结论",
+                history_msgs = await self._build_discussion_history(
+                    runtime_group,
+                    request.user_id,
+                    request.instruction or "总结并提炼群聊结论",
+                    history_limit=100,
                 )
-                if memory_block:
-                    history_msgs = [TextMessage(content=memory_block, source="system")] + history_msgs
                 toolkits = self._build_toolkits(runtime_group, request.user_id)
 
                 ai_group_chat = AIGroupChat(
@@ -825,6 +840,9 @@ class ChatService:
     def get_messages(self, group_id: str, limit: int = 50) -> list[Message]:
         return self.repo.get_messages(group_id, limit)
 
+    def get_messages_json(self, group_id: str, limit: int = 50) -> bytes:
+        return self.repo.dump_messages_json(group_id, limit)
+
 
 def _sanitize_name(name: str) -> str:
     """将名称转换为 AutoGen 兼容格式"""
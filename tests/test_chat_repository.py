@@ -0,0 +1,50 @@
+"""ChatRepository 群聊缓存测试（用内存中的假 DAO，不需要数据库）"""
+
+from ai_group_chat.models import GroupChat
+from ai_group_chat.services.chat_repository import ChatRepository
+
+
+class FakeGroupDAO:
+    def __init__(self):
+        self.loads = 0
+        self.on_load = None
+
+    def get_with_members(self, *, group_id=None, name=None):
+        self.loads += 1
+        if self.on_load:
+            self.on_load()
+        group_id = group_id or f"id-{name}"
+        return {"id": group_id, "name": name or f"name-{group_id}"}, []
+
+    def _row_to_group(self, row, members=None):
+        return GroupChat(id=row["id"], name=row["name"], members=members or [])
+
+
+def _repo() -> ChatRepository:
+    repo = ChatRepository()
+    repo.group_dao = FakeGroupDAO()
+    return repo
+
+
+def test_cache_eviction_keeps_serving_groups():
+    repo = _repo()
+    size = repo.GROUP_CACHE_SIZE
+    for i in range(size + 1):
+        assert repo.get_group(f"g{i}").id == f"g{i}"
+    assert len(repo._group_cache) == size
+    # 最早的群已被淘汰，名称索引同步清理，再次访问重新加载
+    assert "name-g0" not in repo._group_ids_by_name
+    assert repo.get_group_by_name("name-g0").id == "id-name-g0"
+
+
+def test_load_racing_with_write_is_not_cached():
+    repo = _repo()
+    # 读库期间另一线程完成写入并失效缓存：本次读到的可能是旧数据，不能放入缓存
+    repo.group_dao.on_load = lambda: repo._invalidate_group("g1")
+    repo.get_group("g1")
+    assert "g1" not in repo._group_cache
+
+    repo.group_dao.on_load = None
+    repo.get_group("g1")
+    repo.get_group("g1")
+    assert repo.group_dao.loads == 2
@@ -0,0 +1,34 @@
+"""GroupDAO 集成测试（需要可连接的 Postgres，连不上时跳过）"""
+
+import pytest
+
+from ai_group_chat.dao import db, group_dao
+
+
+@pytest.fixture
+def group_id():
+    try:
+        ready = db.initialize()
+    except Exception as e:
+        pytest.skip(f"数据库不可用: {e}")
+    if not ready:
+        pytest.skip("数据库不可用")
+    row = group_dao.create("manager-config-test")
+    yield row["id"]
+    group_dao.delete(row["id"])
+
+
+def test_same_manager_temperature_touches_no_rows(group_id):
+    assert group_dao.update_manager_config(group_id, "gpt-4o-mini", temperature=0.3) == (True, True)
+    # REAL 列与 float8 参数比较时须按 real 对齐，否则相同温度也会被当作变化
+    assert group_dao.update_manager_config(group_id, "gpt-4o-mini", temperature=0.3) == (True, False)
+    assert group_dao.update_manager_config(group_id, "gpt-4o-mini", thinking=False, temperature=0.3) == (True, False)
+
+
+def test_missing_group_is_not_updated():
+    try:
+        if not db.initialize():
+            pytest.skip("数据库不可用")
+    except Exception as e:
+        pytest.skip(f"数据库不可用: {e}")
+    assert group_dao.update_manager_config("no-such-group", "gpt-4o-mini", temperature=0.3) == (False, False)
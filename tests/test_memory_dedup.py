@@ -0,0 +1,44 @@
+"""长期记忆检索去重测试"""
+
+from ai_group_chat.memory.long_term_memory_service import LongTermMemoryService
+
+
+def _drop(contents: list[str]) -> list[str]:
+    service = LongTermMemoryService.__new__(LongTermMemoryService)
+    rows = [{"content": c, "retrieval_score": 1.0 - i * 0.01} for i, c in enumerate(contents)]
+    return [row["content"] for row in service._drop_near_duplicates(rows)]
+
+
+def test_identical_content_across_scopes_is_dropped():
+    content = "用户喜欢在周末讨论科幻小说。"
+    assert _drop([content, content, "用户喜欢在周末讨论科幻小说"]) == [content]
+
+
+def test_single_word_difference_is_kept():
+    contents = [
+        "用户要求所有回复都使用中文，并且保持简洁。",
+        "用户要求所有回复都使用英文，并且保持简洁。",
+    ]
+    assert _drop(contents) == contents
+
+
+def test_different_dates_are_kept():
+    contents = [
+        "项目评审会定在3月15日下午举行。",
+        "项目评审会定在3月25日下午举行。",
+    ]
+    assert _drop(contents) == contents
+
+
+def test_word_order_difference_is_kept():
+    contents = [
+        "User prefers Python over Java.",
+        "User prefers Java over Python.",
+    ]
+    assert _drop(contents) == contents
+
+
+def test_case_and_punctuation_differences_are_dropped():
+    assert _drop(["User prefers Python over Java.", "user prefers python over java"]) == [
+        "User prefers Python over Java."
+    ]